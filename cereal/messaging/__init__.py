@@ -1,10 +1,14 @@
 # must be build with scons
-from .messaging_pyx import Context, Poller, SubSocket, PubSocket  # pylint: disable=no-name-in-module, import-error
+from .messaging_pyx import Context, Poller, SubSocket, PubSocket, MessageBuffer  # pylint: disable=no-name-in-module, import-error
 from .messaging_pyx import MultiplePublishersError, MessagingError  # pylint: disable=no-name-in-module, import-error
+import os
 import capnp
+import heapq
+import weakref
 
 assert MultiplePublishersError
 assert MessagingError
+assert MessageBuffer
 
 from cereal import log
 from cereal.services import service_list
@@ -17,6 +21,13 @@ except ImportError:
   sec_since_boot = time.time
   print("Warning, using python time.time() instead of faster sec_since_boot")
 
+# log to cloudlog inside openpilot, allow to run standalone too
+try:
+  from selfdrive.swaglog import cloudlog
+except ImportError:
+  import logging
+  cloudlog = logging.getLogger(__name__)
+
 context = Context()
 
 def new_message():
@@ -25,6 +36,126 @@ def new_message():
   dat.valid = True
   return dat
 
+class MessageBuilder():
+  """Reusable builder for the messages of one service, avoids allocating a new event every frame.
+
+  reset() hands out the same preallocated event each time, fields keep their previous values until they
+  are overwritten. Overwriting scalar fields is free, but setting a struct, list or text field again
+  orphans the old value inside the message. The event is reallocated once orphans have doubled its size.
+  logMonoTime is stamped when the message is serialized."""
+  def __init__(self, service, size=None):
+    self.service = service
+    self.size = size
+    self._alloc()
+
+  def _alloc(self):
+    self.msg = log.Event.new_message()
+    if self.size is None:
+      self.msg.init(self.service)
+    else:
+      self.msg.init(self.service, self.size)
+    self.msg.valid = True
+    self.base_size = None
+    self.last_size = 0
+
+  def reset(self, size=None):
+    """Returns the event to refill. For list services, a different size reinitializes the list."""
+    if self.base_size is not None and self.last_size > 2 * self.base_size:
+      self.size = size if size is not None else self.size
+      self._alloc()
+    elif size is not None and size != self.size:
+      self.size = size
+      self.msg.init(self.service, size)
+    return self.msg
+
+  def to_bytes(self):
+    self.msg.logMonoTime = int(sec_since_boot() * 1e9)
+    dat = self.msg.to_bytes()
+    # refilling is intended, silence pycapnp's warning about writing a message twice
+    self.msg.clear_write_flag()
+
+    if self.base_size is None:
+      self.base_size = len(dat)
+    self.last_size = len(dat)
+    return dat
+
+class SocketStats():
+  def __init__(self, service):
+    self.service = service
+    self.received = 0
+    self.dropped = 0
+    self.max_queue_depth = 0
+    self.latencies = []
+
+  def record(self, msgs, depth, dropped, cur_time):
+    self.received += len(msgs)
+    self.dropped += dropped
+    self.max_queue_depth = max(self.max_queue_depth, depth)
+
+    # only the newest message is sampled
+    if len(self.latencies) < MessagingStats.MAX_LATENCY_SAMPLES:
+      self.latencies.append(cur_time - msgs[-1].logMonoTime * 1e-9)
+
+
+class MessagingStats():
+  """Receive statistics of every socket read with the recv helpers in this module. Recording is cheap
+  bookkeeping, publishing on messagingStats is left to the process, which calls update() from its loop.
+  Only one process can publish messagingStats at a time, other processes only keep their stats locally."""
+  MAX_LATENCY_SAMPLES = 1000
+
+  def __init__(self, interval=1.):
+    self.interval = interval
+    # stats of closed sockets go away with them
+    self.sockets = weakref.WeakKeyDictionary()
+    self.last_report = sec_since_boot()
+
+    try:
+      self.sock = pub_sock('messagingStats')
+    except MultiplePublishersError:
+      cloudlog.warning("messagingStats is already published by another process")
+      self.sock = None
+
+  def record(self, sock, msgs, depth, dropped=0):
+    st = self.sockets.get(sock)
+    if st is None:
+      st = self.sockets[sock] = SocketStats(msgs[-1].which())
+    st.record(msgs, depth, dropped, sec_since_boot())
+
+  def update(self):
+    """Publishes a report if interval seconds have passed since the last one"""
+    cur_time = sec_since_boot()
+    if cur_time - self.last_report > self.interval:
+      self.report()
+      self.last_report = cur_time
+
+  def report(self):
+    dat = new_message()
+    dat.init('messagingStats')
+    dat.messagingStats.pid = os.getpid()
+    stats = list(self.sockets.values())
+    sockets = dat.messagingStats.init('sockets', len(stats))
+    for i, st in enumerate(stats):
+      sockets[i].service = st.service
+      sockets[i].received = st.received
+      sockets[i].dropped = st.dropped
+      sockets[i].maxQueueDepth = st.max_queue_depth
+      sockets[i].latencies = st.latencies
+      st.max_queue_depth = 0
+      st.latencies = []
+
+    if self.sock is not None:
+      self.sock.send(dat.to_bytes())
+    return dat
+
+stats = None
+
+def enable_stats(interval=1.):
+  """Starts recording receive and drop counts, queue depth and latency of every socket. Call update() on the
+  returned MessagingStats to publish them."""
+  global stats
+  stats = MessagingStats(interval)
+  return stats
+
 def pub_sock(endpoint):
   sock = PubSocket()
   sock.connect(context, endpoint)
@@ -42,6 +173,9 @@ def sub_sock(endpoint, poller=None, addr="127.0.0.1", conflate=False, timeout=No
     poller.registerSocket(sock)
   return sock
 
+# The recv helpers below take zero_copy=True to receive into a MessageBuffer instead of bytes. The returned
+# reader points into the buffer instead of owning a copy. Zero copy readers are read only, and are only
+# guaranteed to be valid until the next receive on the socket they came from. Use .as_builder() to keep one longer.
 
 def drain_sock_raw(sock, wait_for_one=False):
   """Receive all message currently available on the queue"""
@@ -59,14 +193,14 @@ def drain_sock_raw(sock, wait_for_one=False):
 
   return ret
 
-def drain_sock(sock, wait_for_one=False):
+def drain_sock(sock, wait_for_one=False, zero_copy=False):
   """Receive all message currently available on the queue"""
   ret = []
   while 1:
     if wait_for_one and len(ret) == 0:
-      dat = sock.receive()
+      dat = sock.receive(copy=not zero_copy)
     else:
-      dat = sock.receive(non_blocking=True)
+      dat = sock.receive(non_blocking=True, copy=not zero_copy)
 
     if dat is None: # Timeout hit
       break
@@ -74,40 +208,49 @@ def drain_sock(sock, wait_for_one=False):
     dat = log.Event.from_bytes(dat)
     ret.append(dat)
 
+  if stats is not None and len(ret):
+    stats.record(sock, ret, len(ret))
   return ret
 
 
-# TODO: print when we drop packets?
-def recv_sock(sock, wait=False):
+def recv_sock(sock, wait=False, zero_copy=False):
   """Same as drain sock, but only returns latest message. Consider using conflate instead."""
   dat = None
+  cnt = 0
 
   while 1:
     if wait and dat is None:
-      rcv = sock.receive()
+      rcv = sock.receive(copy=not zero_copy)
     else:
-      rcv = sock.receive(non_blocking=True)
+      rcv = sock.receive(non_blocking=True, copy=not zero_copy)
 
     if rcv is None: # Timeout hit
       break
 
     dat = rcv
+    cnt += 1
 
   if dat is not None:
     dat = log.Event.from_bytes(dat)
+    if stats is not None:
+      stats.record(sock, [dat], cnt, cnt - 1)
 
   return dat
 
-def recv_one(sock):
-  dat = sock.receive()
+def recv_one(sock, zero_copy=False):
+  dat = sock.receive(copy=not zero_copy)
   if dat is not None:
     dat = log.Event.from_bytes(dat)
+    if stats is not None:
+      stats.record(sock, [dat], 1)
   return dat
 
-def recv_one_or_none(sock):
-  dat = sock.receive(non_blocking=True)
+def recv_one_or_none(sock, zero_copy=False):
+  dat = sock.receive(non_blocking=True, copy=not zero_copy)
   if dat is not None:
     dat = log.Event.from_bytes(dat)
+    if stats is not None:
+      stats.record(sock, [dat], 1)
   return dat
 
 def recv_one_retry(sock):
@@ -115,7 +258,10 @@ def recv_one_retry(sock):
   while True:
     dat = sock.receive()
     if dat is not None:
-      return log.Event.from_bytes(dat)
+      dat = log.Event.from_bytes(dat)
+      if stats is not None:
+        stats.record(sock, [dat], 1)
+      return dat
 
 # TODO: This does not belong in messaging
 def get_one_can(logcan):
@@ -125,8 +271,12 @@ def get_one_can(logcan):
       return can
 
 class SubMaster():
-  def __init__(self, services, ignore_alive=None, addr="127.0.0.1"):
+  def __init__(self, services, ignore_alive=None, addr="127.0.0.1", zero_copy=False):
+    """With zero_copy the messages are received without a copy, see the recv helpers. Only use
+    it when the data of a service isn't kept past the next update."""
     self.poller = Poller()
+    self.zero_copy = zero_copy
+    self.trigger_pollers = {}
     self.frame = -1
     self.updated = {s : False for s in services}
     self.rcv_time = {s : 0. for s in services}
@@ -143,10 +293,22 @@ class SubMaster():
     else:
       self.ignore_alive = []
 
+    # liveness is tracked incrementally: a service stays alive until its deadline, 10x its expected
+    # period after the last receive. Deadlines live in a heap with lazy deletion, a heap entry is stale
+    # when it doesn't match self.deadline anymore. Services with a frequency of 0 never expire.
+    self.timeout = {}
+    self.deadline = {}
+    self.deadlines = []
+    self.updated_list = []
+    self.num_dead = sum(1 for s in services if s not in self.ignore_alive)
+    self.num_invalid = 0
+
     for s in services:
       if addr is not None:
         self.sock[s] = sub_sock(s, poller=self.poller, addr=addr, conflate=True)
       self.freq[s] = service_list[s].frequency
+      # arbitrary small number to avoid float comparison
+      self.timeout[s] = 10. / self.freq[s] if self.freq[s] > 1e-5 else None
 
       data = new_message()
       try:
@@ -162,60 +324,147 @@ class SubMaster():
   def __getitem__(self, s):
     return self.data[s]
 
-  def update(self, timeout=1000):
+  def update(self, timeout=1000, wait_for=None):
+    """Receives new messages. If wait_for is a service or a list of services, this only wakes up when
+    one of them arrives (or on timeout), and then folds in whatever is queued on the other services."""
+    if wait_for is None:
+      socks = self.poller.poll(timeout)
+    else:
+      self._trigger_poller(wait_for).poll(timeout)
+      socks = self.sock.values()
+
     msgs = []
-    for sock in self.poller.poll(timeout):
-      msgs.append(recv_one_or_none(sock))
+    for sock in socks:
+      msgs.append(recv_one_or_none(sock, zero_copy=self.zero_copy))
     self.update_msgs(sec_since_boot(), msgs)
 
+  def _trigger_poller(self, wait_for):
+    if isinstance(wait_for, str):
+      wait_for = (wait_for,)
+    wait_for = tuple(wait_for)
+
+    if wait_for not in self.trigger_pollers:
+      poller = Poller()
+      for s in wait_for:
+        poller.registerSocket(self.sock[s])
+      self.trigger_pollers[wait_for] = poller
+    return self.trigger_pollers[wait_for]
+
   def update_msgs(self, cur_time, msgs):
-    # TODO: add optional input that specify the service to wait for
     self.frame += 1
-    self.updated = dict.fromkeys(self.updated, False)
+    for s in self.updated_list:
+      self.updated[s] = False
+    self.updated_list = []
+
     for msg in msgs:
       if msg is None:
         continue
 
       s = msg.which()
-      self.updated[s] = True
+      if not self.updated[s]:
+        self.updated[s] = True
+        self.updated_list.append(s)
       self.rcv_time[s] = cur_time
       self.rcv_frame[s] = self.frame
       self.data[s] = getattr(msg, s)
       self.logMonoTime[s] = msg.logMonoTime
-      self.valid[s] = msg.valid
 
+      if msg.valid != self.valid[s]:
+        self.num_invalid += -1 if msg.valid else 1
+        self.valid[s] = msg.valid
+
+      if self.timeout[s] is not None and self.frame > 0:
+        deadline = cur_time + self.timeout[s]
+        if deadline != self.deadline[s]:
+          self.deadline[s] = deadline
+          heapq.heappush(self.deadlines, (deadline, s))
+        self._set_alive(s, True)
+
+    if self.frame == 0:
+      self._reset_alive(cur_time)
+
+    # alive if delay is within 10x the expected frequency
+    while self.deadlines and self.deadlines[0][0] <= cur_time:
+      deadline, s = heapq.heappop(self.deadlines)
+      if deadline == self.deadline[s]:
+        self._set_alive(s, False)
+
+  def _set_alive(self, s, alive):
+    if alive != self.alive[s]:
+      self.alive[s] = alive
+      if s not in self.ignore_alive:
+        self.num_dead += -1 if alive else 1
+
+  def _reset_alive(self, cur_time):
+    self.deadlines = []
     for s in self.data:
-      # arbitrary small number to avoid float comparison. If freq is 0, we can skip the check
-      if self.freq[s] > 1e-5:
-        # alive if delay is within 10x the expected frequency
-        self.alive[s] = (cur_time - self.rcv_time[s]) < (10. / self.freq[s])
-      else:
-        self.alive[s] = True
+      if self.timeout[s] is not None:
+        self.deadline[s] = self.rcv_time[s] + self.timeout[s]
+        self.deadlines.append((self.deadline[s], s))
+      self._set_alive(s, self.timeout[s] is None or cur_time < self.deadline[s])
+    heapq.heapify(self.deadlines)
 
   def all_alive(self, service_list=None):
     if service_list is None:  # check all
-      service_list = self.alive.keys()
+      return self.num_dead == 0
     return all(self.alive[s] for s in service_list if s not in self.ignore_alive)
 
   def all_valid(self, service_list=None):
     if service_list is None:  # check all
-      service_list = self.valid.keys()
+      return self.num_invalid == 0
     return all(self.valid[s] for s in service_list)
 
   def all_alive_and_valid(self, service_list=None):
-    if service_list is None:  # check all
-      service_list = self.alive.keys()
     return self.all_alive(service_list=service_list) and self.all_valid(service_list=service_list)
 
 
 class PubMaster():
   def __init__(self, services):
     self.sock = {}
+    self.builders = {}
+    # time spent serializing and sending the last message of each service, in seconds
+    self.serialize_time = {}
+    self.send_time = {}
     for s in services:
       self.sock[s] = pub_sock(s)
+      self.serialize_time[s] = 0.
+      self.send_time[s] = 0.
+
+  def builder(self, s, size=None):
+    """Returns the reusable MessageBuilder of a service, see MessageBuilder"""
+    if s not in self.builders:
+      self.builders[s] = MessageBuilder(s, size)
+    return self.builders[s]
+
+  def _serialize(self, s, dat):
+    # accept either bytes, capnp builder or MessageBuilder
+    if isinstance(dat, bytes):
+      self.serialize_time[s] = 0.
+      return dat
+
+    # events handed out by builder() are serialized by their MessageBuilder, which stamps logMonoTime
+    if s in self.builders and dat is self.builders[s].msg:
+      dat = self.builders[s]
+
+    t = sec_since_boot()
+    dat = dat.to_bytes()
+    self.serialize_time[s] = sec_since_boot() - t
+    return dat
+
+  def _send(self, s, dat):
+    t = sec_since_boot()
+    self.sock[s].send(dat)
+    self.send_time[s] = sec_since_boot() - t
 
   def send(self, s, dat):
-    # accept either bytes or capnp builder
-    if not isinstance(dat, bytes):
-      dat = dat.to_bytes()
-    self.sock[s].send(dat)
+    self._send(s, self._serialize(s, dat))
+
+  def send_many(self, msgs):
+    """Sends a list of (service, dat) pairs. Everything is serialized first, so the sends go out back to back.
+
+    This does not reduce allocations, every builder is still serialized into new bytes by to_bytes(). pycapnp
+    can't serialize into a caller's buffer, so there is no scratch buffer per service to reuse. The only copy
+    saved is on the send side, where PubSocket.send passes the bytes to the socket directly."""
+    msgs = [(s, self._serialize(s, dat)) for s, dat in msgs]
+    for s, dat in msgs:
+      self._send(s, dat)
@@ -0,0 +1,113 @@
+"""asyncio front end for cereal.messaging, for non realtime daemons that multiplex sockets and network I/O in one thread.
+
+With zmq the event loop waits on the socket file descriptors.
+
+msgq gets no benefit from this module. msgq wakes up readers with signals and has no file descriptor, so msgq sockets
+are polled every MSGQ_POLL_INTERVAL seconds. That adds up to MSGQ_POLL_INTERVAL of latency and wakes the loop 100 times
+a second while waiting. Use the blocking helpers in cereal.messaging, or zmq, where that matters.
+"""
+import asyncio
+import weakref
+
+from cereal.messaging import SubMaster, log, recv_one_or_none, sec_since_boot
+
+MSGQ_POLL_INTERVAL = 0.01
+
+
+# futures waiting on each fd, per event loop. A loop has one reader per fd, which wakes up all of them
+_waiters = weakref.WeakKeyDictionary()
+
+
+def _wake(loop, fd):
+  for fut in _waiters[loop][fd]:
+    if not fut.done():
+      fut.set_result(None)
+
+
+def _add_waiter(loop, fd, fut):
+  waiters = _waiters.setdefault(loop, {})
+  if fd not in waiters:
+    waiters[fd] = set()
+    loop.add_reader(fd, _wake, loop, fd)
+  waiters[fd].add(fut)
+
+
+def _remove_waiter(loop, fd, fut):
+  waiters = _waiters[loop]
+  waiters[fd].discard(fut)
+  if len(waiters[fd]) == 0:
+    del waiters[fd]
+    loop.remove_reader(fd)
+
+
+async def wait_readable(socks, timeout=None):
+  """Waits until one of the sockets might have a message, or timeout seconds have passed.
+  Wakeups can be spurious, a non blocking receive tells if there really is a message."""
+  loop = asyncio.get_running_loop()
+  fds = set(sock.fileno() for sock in socks)
+
+  if len(fds) == 0 or min(fds) < 0:
+    await asyncio.sleep(MSGQ_POLL_INTERVAL if timeout is None else min(MSGQ_POLL_INTERVAL, timeout))
+    return
+
+  ready = loop.create_future()
+  for fd in fds:
+    _add_waiter(loop, fd, ready)
+  try:
+    await asyncio.wait_for(ready, timeout)
+  except asyncio.TimeoutError:
+    pass
+  finally:
+    for fd in fds:
+      _remove_waiter(loop, fd, ready)
+
+
+def _remaining(deadline):
+  return None if deadline is None else max(deadline - sec_since_boot(), 0.)
+
+
+async def recv(sock, timeout=None):
+  """Awaitable SubSocket.receive, returns the raw message or None after timeout seconds"""
+  deadline = None if timeout is None else sec_since_boot() + timeout
+  while True:
+    dat = sock.receive(non_blocking=True)
+    if dat is not None:
+      return dat
+
+    remaining = _remaining(deadline)
+    if remaining == 0.:
+      return None
+    await wait_readable([sock], remaining)
+
+
+async def recv_one(sock, timeout=None):
+  dat = await recv(sock, timeout)
+  if dat is not None:
+    dat = log.Event.from_bytes(dat)
+  return dat
+
+
+class AsyncSubMaster(SubMaster):
+  """SubMaster with an awaitable update(), see SubMaster.update"""
+
+  async def update(self, timeout=1000, wait_for=None):  # pylint: disable=invalid-overridden-method
+    if wait_for is None:
+      wait_for = self.sock.keys()
+    elif isinstance(wait_for, str):
+      wait_for = [wait_for]
+    triggers = [self.sock[s] for s in wait_for]
+    deadline = None if timeout is None else sec_since_boot() + timeout / 1000.
+
+    msgs = []
+    while True:
+      for sock in self.sock.values():
+        msg = recv_one_or_none(sock)
+        if msg is not None:
+          msgs.append(msg)
+
+      remaining = _remaining(deadline)
+      if remaining == 0. or any(msg.which() in wait_for for msg in msgs):
+        break
+      await wait_readable(triggers, remaining)
+
+    self.update_msgs(sec_since_boot(), msgs)
@@ -0,0 +1,202 @@
+#!/usr/bin/env python3
+"""Benchmark of the msgq and zmq backends, prints the results as JSON for regression tracking.
+
+Every configuration runs in its own processes: one publisher and 1..N subscribers, the backend is selected with
+the ZMQ environment variable like everywhere else. Subscribers are Python, or C++ when benchmark_sub is built,
+which only happens with scons --test. Messages carry their send time, so subscribers measure latency, throughput, dropped messages and CPU per message.
+
+Don't run this next to openpilot, it publishes on the real service endpoints.
+"""
+import os
+import sys
+import json
+import time
+import struct
+import argparse
+import resource
+import itertools
+import subprocess
+
+import numpy as np
+
+HEADER = struct.Struct("<QQ")  # monotonic send time in ns, sequence number
+END = 2**64 - 1
+
+# typical serialized size of these services on device, in bytes
+SERVICE_SIZES = {
+  'frame': 200,
+  'controlsState': 500,
+  'can': 3200,
+  'model': 5000,
+}
+
+BENCHMARK_DIR = os.path.dirname(os.path.abspath(__file__))
+CPP_SUB = os.path.join(BENCHMARK_DIR, "benchmark_sub")
+
+
+def cpu_time():
+  usage = resource.getrusage(resource.RUSAGE_SELF)
+  return usage.ru_utime + usage.ru_stime
+
+
+def run_sub(endpoint, conflate):
+  import cereal.messaging as messaging
+  sock = messaging.sub_sock(endpoint, conflate=conflate, timeout=1000)
+  print("ready", flush=True)
+
+  latencies = []
+  dropped = 0
+  last_seq = None
+  start_time, end_time = None, None
+  cpu_start = cpu_time()
+  while True:
+    dat = sock.receive()
+    if dat is None:
+      break
+
+    t = time.monotonic_ns()
+    send_time, seq = HEADER.unpack_from(dat)
+    if seq == END:
+      break
+
+    if start_time is None:
+      start_time = t
+    end_time = t
+    latencies.append(t - send_time)
+    if last_seq is not None:
+      dropped += seq - last_seq - 1
+    last_seq = seq
+
+  received = len(latencies)
+  elapsed = (end_time - start_time) / 1e9 if received > 1 else 0.
+  print(json.dumps({
+    'received': received,
+    'dropped': dropped,
+    'throughput': received / elapsed if elapsed > 0 else 0.,
+    'p50_us': float(np.percentile(latencies, 50)) / 1e3 if received else None,
+    'p99_us': float(np.percentile(latencies, 99)) / 1e3 if received else None,
+    'cpu_per_msg_us': (cpu_time() - cpu_start) / received * 1e6 if received else None,
+  }), flush=True)
+
+
+def run_pub(endpoint, size, count, rate):
+  import cereal.messaging as messaging
+  sock = messaging.pub_sock(endpoint)
+  print("ready", flush=True)
+  sys.stdin.readline()
+
+  payload = bytearray(max(size, HEADER.size))
+  cpu_start = cpu_time()
+  start_time = time.monotonic()
+  for seq in range(count):
+    if rate > 0:
+      dt = start_time + seq / rate - time.monotonic()
+      if dt > 0:
+        time.sleep(dt)
+    HEADER.pack_into(payload, 0, time.monotonic_ns(), seq)
+    sock.send(payload)
+  cpu_per_msg = (cpu_time() - cpu_start) / count * 1e6
+
+  # subscribers may lag behind, give them a few chances to see the end
+  for _ in range(3):
+    time.sleep(0.05)
+    HEADER.pack_into(payload, 0, time.monotonic_ns(), END)
+    sock.send(payload)
+
+  print(json.dumps({'cpu_per_msg_us': cpu_per_msg}), flush=True)
+
+
+def _result(proc):
+  out, _ = proc.communicate()
+  # msgq prints warnings on stdout, the result is the last json line
+  lines = [l for l in out.decode('utf8').splitlines() if l.startswith('{')]
+  return json.loads(lines[-1]) if len(lines) else None
+
+
+def _wait_ready(proc):
+  while proc.stdout.readline().strip() != b"ready":
+    pass
+
+
+def run_config(backend, service, num_subs, conflate, endpoint, count, rate):
+  env = dict(os.environ)
+  env.pop('ZMQ', None)
+  if backend == 'zmq':
+    env['ZMQ'] = '1'
+
+  me = [sys.executable, os.path.abspath(__file__)]
+  pub = subprocess.Popen(me + ['--pub', service, '--size', str(SERVICE_SIZES[service]), '--count', str(count), '--rate', str(rate)],
+                         env=env, stdin=subprocess.PIPE, stdout=subprocess.PIPE)
+  _wait_ready(pub)
+
+  sub_cmd = [CPP_SUB, service, str(int(conflate))] if endpoint == 'cpp' else me + ['--sub', service] + (['--conflate'] if conflate else [])
+  subs = [subprocess.Popen(sub_cmd, env=env, stdout=subprocess.PIPE) for _ in range(num_subs)]
+  for sub in subs:
+    _wait_ready(sub)
+  time.sleep(0.5)  # slow joiner
+
+  pub.stdin.write(b"go\n")
+  pub.stdin.flush()
+  sub_results = [_result(sub) for sub in subs]
+  pub_result = _result(pub)
+
+  valid = [r for r in sub_results if r is not None and r['received'] > 0]
+  return {
+    'backend': backend,
+    'service': service,
+    'size': SERVICE_SIZES[service],
+    'subscribers': num_subs,
+    'conflate': conflate,
+    'endpoint': endpoint,
+    'count': count,
+    'rate': rate,
+    'throughput': float(np.mean([r['throughput'] for r in valid])) if valid else 0.,
+    'dropped': sum(r['dropped'] for r in valid),
+    'p50_us': float(np.median([r['p50_us'] for r in valid])) if valid else None,
+    'p99_us': max(r['p99_us'] for r in valid) if valid else None,
+    'sub_cpu_per_msg_us': float(np.mean([r['cpu_per_msg_us'] for r in valid])) if valid else None,
+    'pub_cpu_per_msg_us': pub_result['cpu_per_msg_us'] if pub_result is not None else None,
+    'per_subscriber': sub_results,
+  }
+
+
+if __name__ == "__main__":
+  parser = argparse.ArgumentParser(description="Benchmark msgq vs zmq, prints JSON results")
+  parser.add_argument("--backends", nargs='+', default=['msgq', 'zmq'], choices=['msgq', 'zmq'])
+  parser.add_argument("--services", nargs='+', default=list(SERVICE_SIZES.keys()), choices=list(SERVICE_SIZES.keys()))
+  parser.add_argument("--subscribers", type=int, default=4, help="runs 1..N subscribers")
+  parser.add_argument("--endpoints", nargs='+', default=['python', 'cpp'], choices=['python', 'cpp'])
+  parser.add_argument("--count", type=int, default=10000, help="messages per configuration")
+  parser.add_argument("--rate", type=float, default=0., help="messages per second, 0 for as fast as possible")
+  parser.add_argument("--out", help="write the results to a file instead of stdout")
+
+  # internal, used for the publisher and subscriber processes
+  parser.add_argument("--pub", help=argparse.SUPPRESS)
+  parser.add_argument("--sub", help=argparse.SUPPRESS)
+  parser.add_argument("--size", type=int, help=argparse.SUPPRESS)
+  parser.add_argument("--conflate", action="store_true", help=argparse.SUPPRESS)
+  args = parser.parse_args()
+
+  if args.sub is not None:
+    run_sub(args.sub, args.conflate)
+  elif args.pub is not None:
+    run_pub(args.pub, args.size, args.count, args.rate)
+  else:
+    endpoints = args.endpoints
+    if 'cpp' in endpoints and not os.path.isfile(CPP_SUB):
+      print("Warning, %s is not built, skipping C++ subscribers" % CPP_SUB, file=sys.stderr)
+      endpoints = [e for e in endpoints if e != 'cpp']
+
+    results = []
+    configs = itertools.product(args.backends, args.services, range(1, args.subscribers + 1), [False, True], endpoints)
+    for backend, service, num_subs, conflate, endpoint in configs:
+      results.append(run_config(backend, service, num_subs, conflate, endpoint, args.count, args.rate))
+      print("%s %s subs=%d conflate=%d %s: %.0f msg/s, p50 %.1f us, p99 %.1f us" %
+            (backend, service, num_subs, conflate, endpoint, results[-1]['throughput'],
+             results[-1]['p50_us'] or 0., results[-1]['p99_us'] or 0.), file=sys.stderr)
+
+    if args.out is not None:
+      with open(args.out, "w") as f:
+        json.dump(results, f, indent=2)
+    else:
+      print(json.dumps(results, indent=2))
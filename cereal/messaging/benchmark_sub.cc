@@ -0,0 +1,91 @@
+// C++ subscriber for benchmark.py: benchmark_sub <endpoint> <conflate>
+#include <iostream>
+#include <cstdio>
+#include <cstdint>
+#include <cstring>
+#include <ctime>
+#include <string>
+#include <vector>
+#include <algorithm>
+#include <sys/resource.h>
+
+#include "messaging.hpp"
+
+#define END UINT64_MAX
+
+static uint64_t monotonic_ns(){
+  struct timespec t;
+  clock_gettime(CLOCK_MONOTONIC, &t);
+  return (uint64_t)t.tv_sec * 1000000000ULL + t.tv_nsec;
+}
+
+static double cpu_time(){
+  struct rusage usage;
+  getrusage(RUSAGE_SELF, &usage);
+  return usage.ru_utime.tv_sec + usage.ru_stime.tv_sec + (usage.ru_utime.tv_usec + usage.ru_stime.tv_usec) / 1e6;
+}
+
+static double percentile(std::vector<uint64_t> &v, double p){
+  size_t idx = std::min(v.size() - 1, (size_t)(p / 100. * (v.size() - 1) + 0.5));
+  std::nth_element(v.begin(), v.begin() + idx, v.end());
+  return v[idx] / 1e3;
+}
+
+int main(int argc, char *argv[]) {
+  if (argc != 3){
+    std::cerr << "usage: " << argv[0] << " <endpoint> <conflate>" << std::endl;
+    return 1;
+  }
+
+  Context * c = Context::create();
+  SubSocket * sock = SubSocket::create(c, argv[1], "127.0.0.1", atoi(argv[2]) != 0);
+  sock->setTimeout(1000);
+  std::cout << "ready" << std::endl;
+
+  std::vector<uint64_t> latencies;
+  uint64_t dropped = 0, last_seq = 0, start_time = 0, end_time = 0;
+  bool first = true;
+  double cpu_start = cpu_time();
+
+  while (true){
+    Message * msg = sock->receive();
+    if (msg == NULL){
+      break;
+    }
+
+    uint64_t t = monotonic_ns();
+    uint64_t header[2];
+    memcpy(header, msg->getData(), sizeof(header));
+    delete msg;
+
+    if (header[1] == END){
+      break;
+    }
+
+    if (first){
+      start_time = t;
+    } else {
+      dropped += header[1] - last_seq - 1;
+    }
+    end_time = t;
+    latencies.push_back(t - header[0]);
+    last_seq = header[1];
+    first = false;
+  }
+
+  double cpu = cpu_time() - cpu_start;
+  size_t received = latencies.size();
+  double elapsed = (end_time - start_time) / 1e9;
+
+  if (received == 0){
+    printf("{\"received\": 0, \"dropped\": 0, \"throughput\": 0.0, \"p50_us\": null, \"p99_us\": null, \"cpu_per_msg_us\": null}\n");
+  } else {
+    printf("{\"received\": %zu, \"dropped\": %lu, \"throughput\": %f, \"p50_us\": %f, \"p99_us\": %f, \"cpu_per_msg_us\": %f}\n",
+           received, (unsigned long)dropped, elapsed > 0 ? received / elapsed : 0.,
+           percentile(latencies, 50), percentile(latencies, 99), cpu / received * 1e6);
+  }
+
+  delete sock;
+  delete c;
+  return 0;
+}
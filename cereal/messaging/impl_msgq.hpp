@@ -37,6 +37,7 @@ public:
   int connect(Context *context, std::string endpoint, std::string address, bool conflate=false);
   void setTimeout(int timeout);
   void * getRawSocket() {return (void*)q;}
+  int getFd() {return -1;}
   Message *receive(bool non_blocking=false);
   ~MSGQSubSocket();
 };
@@ -99,6 +99,14 @@ void ZMQSubSocket::setTimeout(int timeout){
   zmq_setsockopt(sock, ZMQ_RCVTIMEO, &timeout, sizeof(int));
 }
 
+int ZMQSubSocket::getFd(){
+  // edge triggered, only signals that zmq has to process events
+  int fd = -1;
+  size_t fd_size = sizeof(fd);
+  zmq_getsockopt(sock, ZMQ_FD, &fd, &fd_size);
+  return fd;
+}
+
 ZMQSubSocket::~ZMQSubSocket(){
   zmq_close(sock);
 }
@@ -35,6 +35,7 @@ public:
   int connect(Context *context, std::string endpoint, std::string address, bool conflate=false);
   void setTimeout(int timeout);
   void * getRawSocket() {return sock;}
+  int getFd();
   Message *receive(bool non_blocking=false);
   ~ZMQSubSocket();
 };
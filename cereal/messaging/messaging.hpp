@@ -29,6 +29,8 @@ public:
   virtual void setTimeout(int timeout) = 0;
   virtual Message *receive(bool non_blocking=false) = 0;
   virtual void * getRawSocket() = 0;
+  // file descriptor that becomes readable when messages may be available, -1 if not supported
+  virtual int getFd() = 0;
   static SubSocket * create();
   static SubSocket * create(Context * context, std::string endpoint);
   static SubSocket * create(Context * context, std::string endpoint, std::string address);
@@ -24,6 +24,7 @@ cdef extern from "messaging.hpp":
     int connect(Context *, string, string, bool)
     Message * receive(bool)
     void setTimeout(int)
+    int getFd()
 
   cdef cppclass PubSocket:
     @staticmethod
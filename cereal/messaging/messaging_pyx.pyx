@@ -5,6 +5,7 @@ import sys
 from libcpp.string cimport string
 from libcpp cimport bool
 from libc cimport errno
+from cpython.buffer cimport PyBuffer_FillInfo
 
 
 from messaging cimport Context as cppContext
@@ -68,9 +69,30 @@ cdef class Poller:
 
     return sockets
 
+cdef class MessageBuffer:
+  """Read only buffer over a received message, freed when the last reference to it is dropped."""
+  cdef cppMessage * msg
+
+  def __dealloc__(self):
+    del self.msg
+
+  def __len__(self):
+    return self.msg.getSize()
+
+  def __getbuffer__(self, Py_buffer *buffer, int flags):
+    PyBuffer_FillInfo(buffer, self, self.msg.getData(), self.msg.getSize(), 1, flags)
+
+  def __releasebuffer__(self, Py_buffer *buffer):
+    pass
+
+  def tobytes(self):
+    return self.msg.getData()[:self.msg.getSize()]
+
+
 cdef class SubSocket:
   cdef cppSubSocket * socket
   cdef bool is_owner
+  cdef object __weakref__
 
   def __cinit__(self):
     self.socket = cppSubSocket.create()
@@ -102,7 +124,13 @@ cdef class SubSocket:
   def setTimeout(self, int timeout):
     self.socket.setTimeout(timeout)
 
-  def receive(self, bool non_blocking=False):
+  def fileno(self):
+    """File descriptor to wait on for new messages, -1 if the backend has none (msgq)"""
+    return self.socket.getFd()
+
+  def receive(self, bool non_blocking=False, bool copy=True):
+    """Returns the next message as bytes, or as a MessageBuffer wrapping the received data if copy is False"""
+    cdef MessageBuffer buf
     msg = self.socket.receive(non_blocking)
 
     if msg == NULL:
@@ -112,6 +140,10 @@ cdef class SubSocket:
         sys.exit(1)
 
       return None
+    elif not copy:
+      buf = MessageBuffer.__new__(MessageBuffer)
+      buf.msg = msg
+      return buf
     else:
       sz = msg.getSize()
       m = msg.getData()[:sz]
@@ -140,9 +172,17 @@ cdef class PubSocket:
       else:
         raise MessagingError
 
-  def send(self, string data):
-    length = len(data)
-    r = self.socket.send(<char*>data.c_str(), length)
+  def send(self, data):
+    """Sends str, bytes or any other contiguous buffer, buffers are passed to the socket without a copy"""
+    cdef const unsigned char[::1] view
+    cdef char empty = 0
+
+    if isinstance(data, str):
+      data = data.encode('utf8')
+    view = data
+
+    length = view.shape[0]
+    r = self.socket.send(<char*>&view[0] if length > 0 else &empty, length)
 
     if r != length:
       if errno.errno == errno.EADDRINUSE:
@@ -0,0 +1,180 @@
+"""Reads a few fields straight out of serialized messages, without building capnp readers for the whole event.
+
+  proj = Projection(["logMonoTime", "carState.vEgo"])
+  log_mono_time, v_ego = proj(dat)
+
+Primitive fields (ints, floats, bools and enums) reached through struct fields, groups and unions are decoded from
+the raw segment. Values of fields behind a union member that isn't set are None. Paths that end in lists, text,
+data or structs, and messages that span far pointers, fall back to pycapnp.
+"""
+import struct
+
+from cereal import log
+
+NO_DISCRIMINANT = 0xffff
+
+# capnp type -> (struct format, size in bytes), bools are bits
+PRIMITIVES = {
+  'bool': (None, None),
+  'int8': ('<b', 1),
+  'int16': ('<h', 2),
+  'int32': ('<i', 4),
+  'int64': ('<q', 8),
+  'uint8': ('<B', 1),
+  'uint16': ('<H', 2),
+  'uint32': ('<I', 4),
+  'uint64': ('<Q', 8),
+  'float32': ('<f', 4),
+  'float64': ('<d', 8),
+  'enum': ('<H', 2),
+}
+UNSIGNED = {1: '<B', 2: '<H', 4: '<I', 8: '<Q'}
+
+
+class _Fallback(Exception):
+  pass
+
+
+def _union(node, proto):
+  if proto.discriminantValue == NO_DISCRIMINANT:
+    return None
+  return node.struct.discriminantOffset * 2, proto.discriminantValue
+
+
+def _compile(schema, path):
+  """Returns the steps to read a field. Paths that end in a non primitive field end in a 'fallback' step,
+  which only checks the unions along the way before handing over to pycapnp."""
+  steps = []
+  node = schema.node
+  for i, name in enumerate(path):
+    field = schema.fields[name]
+    proto = field.proto
+    last = i == len(path) - 1
+    union = _union(node, proto)
+
+    if proto.which() == 'group':
+      if last:
+        steps.append(('fallback', union, None))
+        break
+      steps.append(('group', union, None))
+      schema = field.schema
+      node = schema.node
+      continue
+
+    typ = proto.slot.type.which()
+    if typ == 'struct' and not last:
+      steps.append(('struct', union, proto.slot.offset))
+      schema = field.schema
+      node = schema.node
+    elif typ in PRIMITIVES and last:
+      default = getattr(proto.slot.defaultValue, typ)
+      if typ == 'bool':
+        steps.append(('bool', union, (proto.slot.offset, bool(default))))
+      else:
+        fmt, size = PRIMITIVES[typ]
+        default_bits = struct.unpack(UNSIGNED[size], struct.pack(fmt, default))[0]
+        enumerants = [e.name for e in field.schema.node.enum.enumerants] if typ == 'enum' else None
+        steps.append(('primitive', union, (fmt, size, proto.slot.offset * size, default_bits, enumerants)))
+    else:
+      steps.append(('fallback', union, None))
+      break
+  return steps
+
+
+def _root(dat):
+  """Returns the position of the root pointer of a framed message"""
+  num_segments = struct.unpack_from("<I", dat, 0)[0] + 1
+  return (4 + 4 * num_segments + 7) // 8 * 8
+
+
+def _follow(dat, pos):
+  """Returns (data position, data size in bytes, pointer count) of the struct a pointer points to"""
+  ptr, = struct.unpack_from("<Q", dat, pos)
+  if ptr == 0:
+    # null pointer, all fields have their default value
+    return 0, 0, 0
+  if ptr & 3 != 0:
+    raise _Fallback()
+
+  offset = (ptr >> 2) & 0x3fffffff
+  if offset >= 1 << 29:
+    offset -= 1 << 30
+  return pos + 8 + offset * 8, ((ptr >> 32) & 0xffff) * 8, ptr >> 48
+
+
+def _discriminant(dat, data, data_size, offset):
+  if offset + 2 > data_size:
+    return 0
+  return struct.unpack_from("<H", dat, data + offset)[0]
+
+
+class Projection():
+  def __init__(self, paths, schema=log.Event):
+    self.module = schema
+    self.schema = schema.schema
+    self.paths = [p.split(".") if isinstance(p, str) else list(p) for p in paths]
+    self.steps = [_compile(self.schema, p) for p in self.paths]
+
+    node = self.schema.node
+    self.discriminant_offset = node.struct.discriminantOffset * 2
+    self.union = {f.discriminantValue: f.name for f in node.struct.fields if f.discriminantValue != NO_DISCRIMINANT}
+
+  def which(self, dat):
+    """Name of the root union member that is set, like msg.which()"""
+    try:
+      data, data_size, _ = _follow(dat, _root(dat))
+      return self.union[_discriminant(dat, data, data_size, self.discriminant_offset)]
+    except (_Fallback, struct.error, KeyError):
+      return self.module.from_bytes(dat).which()
+
+  def __call__(self, dat):
+    """Returns the values of all paths, in order"""
+    ret = []
+    reader = None
+    for path, steps in zip(self.paths, self.steps):
+      try:
+        ret.append(self._read(dat, steps))
+      except (_Fallback, struct.error):
+        if reader is None:
+          reader = self.module.from_bytes(dat)
+        ret.append(self._read_reader(reader, path))
+    return ret
+
+  @staticmethod
+  def _read(dat, steps):
+    data, data_size, ptr_count = _follow(dat, _root(dat))
+    for kind, union, arg in steps:
+      if union is not None and _discriminant(dat, data, data_size, union[0]) != union[1]:
+        return None
+
+      if kind == 'struct':
+        if arg >= ptr_count:
+          data, data_size, ptr_count = 0, 0, 0
+        else:
+          data, data_size, ptr_count = _follow(dat, data + data_size + arg * 8)
+      elif kind == 'bool':
+        bit, default = arg
+        if bit // 8 >= data_size:
+          return default
+        return bool((dat[data + bit // 8] >> (bit % 8)) & 1) != default
+      elif kind == 'primitive':
+        fmt, size, offset, default_bits, enumerants = arg
+        bits = struct.unpack_from(UNSIGNED[size], dat, data + offset)[0] if offset + size <= data_size else 0
+        bits ^= default_bits
+        val = struct.unpack(fmt, struct.pack(UNSIGNED[size], bits))[0] if fmt != UNSIGNED[size] else bits
+        if enumerants is not None and val < len(enumerants):
+          return enumerants[val]
+        return val
+      elif kind == 'fallback':
+        raise _Fallback()
+    raise _Fallback()
+
+  @staticmethod
+  def _read_reader(reader, path):
+    try:
+      for name in path:
+        reader = getattr(reader, name)
+      return reader
+    except Exception:  # pylint: disable=broad-except
+      # pycapnp raises when reading a union member that isn't set
+      return None
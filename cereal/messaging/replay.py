@@ -0,0 +1,218 @@
+#!/usr/bin/env python3
+"""Shared memory replay transport.
+
+A log segment is decompressed once into a flat file in REPLAY_DIR and memory mapped. The publisher only sends the
+offset and size of every event over the regular sockets, subscribers map the same file and parse the events straight
+out of the page cache. Any number of replayed processes can consume one segment without copying payloads around.
+
+The index of the events is built by the first process that needs it and saved in REPLAY_DIR too, other processes
+load it instead of walking the segment again. Subscribers never need the index.
+"""
+import os
+import bz2
+import mmap
+import time
+import shutil
+import struct
+import hashlib
+import argparse
+import tempfile
+
+from cereal import log
+from cereal.services import service_list
+from cereal.messaging import pub_sock, sub_sock
+
+REPLAY_DIR = os.path.join(tempfile.gettempdir(), "replay")
+
+OFFSET = struct.Struct("<QQ")
+# offset, size, logMonoTime and union discriminant of an event
+INDEX_ENTRY = struct.Struct("<QQQH")
+
+_UNION = {f.discriminantValue: f.name for f in log.Event.schema.node.struct.fields if f.discriminantValue != 0xffff}
+_UNION_ID = {name: discriminant for discriminant, name in _UNION.items()}
+_DISCRIMINANT_OFFSET = log.Event.schema.node.struct.discriminantOffset * 2
+# saved indexes are only valid for the schema they were written with
+_SCHEMA_KEY = hashlib.sha1(repr(sorted(_UNION.items())).encode("utf8")).hexdigest()[:8]
+
+
+def _cache_dir(fn):
+  """Directory in REPLAY_DIR for the files derived from fn, changes when fn does"""
+  st = os.stat(fn)
+  key = "%s:%d:%d" % (os.path.realpath(fn), st.st_size, st.st_mtime_ns)
+  return os.path.join(REPLAY_DIR, hashlib.sha1(key.encode("utf8")).hexdigest())
+
+
+def _write_atomic(fn, chunks):
+  os.makedirs(os.path.dirname(fn), exist_ok=True)
+  tmp_fn = "%s.%d.tmp" % (fn, os.getpid())
+  with open(tmp_fn, "wb") as f:
+    for chunk in chunks:
+      f.write(chunk)
+  os.rename(tmp_fn, fn)
+
+
+def decompress_segment(fn, out_fn=None):
+  """Returns the path of the decompressed segment. bz2 segments are decompressed into REPLAY_DIR on first use,
+  so logs can be replayed from read only storage."""
+  if not fn.endswith(".bz2"):
+    return fn
+
+  if out_fn is None:
+    out_fn = os.path.join(_cache_dir(fn), os.path.basename(fn)[:-len(".bz2")])
+
+  if not os.path.exists(out_fn) or os.path.getmtime(out_fn) < os.path.getmtime(fn):
+    with bz2.open(fn, "rb") as src:
+      _write_atomic(out_fn, iter(lambda: src.read(1 << 20), b""))
+  return out_fn
+
+
+def _event_info(buf, offset, size, header_size):
+  # read logMonoTime and the union discriminant straight from the root struct when it's in the first segment
+  ptr, = struct.unpack_from("<Q", buf, offset + header_size)
+  if ptr & 3 == 0:
+    ptr_offset = (ptr >> 2) & 0x3fffffff
+    if ptr_offset >= 1 << 29:
+      ptr_offset -= 1 << 30
+    data = offset + header_size + 8 + ptr_offset * 8
+    data_size = ((ptr >> 32) & 0xffff) * 8
+
+    log_mono_time = struct.unpack_from("<Q", buf, data)[0] if data_size >= 8 else 0
+    discriminant = struct.unpack_from("<H", buf, data + _DISCRIMINANT_OFFSET)[0] if data_size >= _DISCRIMINANT_OFFSET + 2 else 0
+    return _UNION[discriminant], log_mono_time
+
+  evt = log.Event.from_bytes(buf[offset:offset + size])
+  return evt.which(), evt.logMonoTime
+
+
+def index_events(buf):
+  """Returns (offset, size, which, logMonoTime) of every event in a decompressed log"""
+  index = []
+  offset = 0
+  while offset < len(buf):
+    num_segments, = struct.unpack_from("<I", buf, offset)
+    num_segments += 1
+    segment_words = struct.unpack_from("<%dI" % num_segments, buf, offset + 4)
+    header_size = (4 + 4 * num_segments + 7) // 8 * 8
+    size = header_size + sum(segment_words) * 8
+
+    which, log_mono_time = _event_info(buf, offset, size, header_size)
+    index.append((offset, size, which, log_mono_time))
+    offset += size
+  return index
+
+
+def load_index(fn, buf):
+  """Returns the index of the decompressed segment fn mapped in buf. Loads the saved index when there
+  is one, otherwise indexes the segment and saves the index for other processes."""
+  index_fn = os.path.join(_cache_dir(fn), "index-" + _SCHEMA_KEY)
+  try:
+    with open(index_fn, "rb") as f:
+      return [(offset, size, _UNION[which], log_mono_time)
+              for offset, size, log_mono_time, which in INDEX_ENTRY.iter_unpack(f.read())]
+  except (OSError, KeyError, struct.error):
+    pass
+
+  index = index_events(buf)
+  try:
+    _write_atomic(index_fn, (INDEX_ENTRY.pack(offset, size, log_mono_time, _UNION_ID[which])
+                             for offset, size, which, log_mono_time in index))
+  except OSError:
+    pass
+  return index
+
+
+class Segment():
+  def __init__(self, fn):
+    self.src_fn = fn
+    self.fn = decompress_segment(fn)
+    with open(self.fn, "rb") as f:
+      self.mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    self.view = memoryview(self.mm)
+    self._index = None
+
+  @property
+  def index(self):
+    """(offset, size, which, logMonoTime) of every event, loaded on first use"""
+    if self._index is None:
+      self._index = load_index(self.fn, self.mm)
+    return self._index
+
+  def remove_cache(self):
+    """Deletes the decompressed copy and the saved index from REPLAY_DIR. The mapping stays valid."""
+    shutil.rmtree(_cache_dir(self.fn), ignore_errors=True)
+    if self.fn != self.src_fn:
+      shutil.rmtree(os.path.dirname(self.fn), ignore_errors=True)
+
+  def __len__(self):
+    return len(self.index)
+
+  def data(self, offset, size):
+    return self.view[offset:offset + size]
+
+  def __getitem__(self, i):
+    offset, size, _, _ = self.index[i]
+    return log.Event.from_bytes(self.data(offset, size))
+
+  def __iter__(self):
+    for offset, size, _, _ in self.index:
+      yield log.Event.from_bytes(self.data(offset, size))
+
+
+class SegmentPublisher():
+  def __init__(self, segment, services=None):
+    self.segment = segment
+    if services is None:
+      services = set(which for _, _, which, _ in segment.index if which in service_list)
+    self.sock = {s: pub_sock(s) for s in services}
+
+  def publish(self, i):
+    offset, size, which, _ = self.segment.index[i]
+    if which in self.sock:
+      self.sock[which].send(OFFSET.pack(offset, size))
+
+  def replay(self, speed=None):
+    """Publishes the whole segment, at speed times the recorded rate or as fast as possible if speed is None"""
+    start_mono_time = self.segment.index[0][3] if len(self.segment) else 0
+    start_time = time.monotonic()
+    for i, (_, _, _, log_mono_time) in enumerate(self.segment.index):
+      if speed is not None:
+        dt = (log_mono_time - start_mono_time) / 1e9 / speed - (time.monotonic() - start_time)
+        if dt > 0:
+          time.sleep(dt)
+      self.publish(i)
+
+
+class SegmentSubSocket():
+  """Wraps a SubSocket that receives offsets from a SegmentPublisher. receive() returns a copy of the event, or
+  with copy=False a memoryview into the mapped segment, valid for as long as the segment is open. Works with the
+  recv helpers of cereal.messaging, to use a Poller register the wrapped socket in .sock."""
+  def __init__(self, segment, sock):
+    self.segment = segment
+    self.sock = sock
+
+  def setTimeout(self, timeout):
+    self.sock.setTimeout(timeout)
+
+  def fileno(self):
+    return self.sock.fileno()
+
+  def receive(self, non_blocking=False, copy=True):
+    dat = self.sock.receive(non_blocking=non_blocking)
+    if dat is None:
+      return None
+    dat = self.segment.data(*OFFSET.unpack(dat))
+    return bytes(dat) if copy else dat
+
+
+def segment_sub_sock(segment, endpoint, **kwargs):
+  return SegmentSubSocket(segment, sub_sock(endpoint, **kwargs))
+
+
+if __name__ == "__main__":
+  parser = argparse.ArgumentParser(description="Publish a log segment over the shared memory replay transport")
+  parser.add_argument("--speed", type=float, default=1., help="replay speed, 0 for as fast as possible")
+  parser.add_argument("segment", help="rlog, bz2 compressed or not")
+  args = parser.parse_args()
+
+  seg = Segment(args.segment)
+  SegmentPublisher(seg).replay(args.speed if args.speed > 0 else None)
@@ -0,0 +1,39 @@
+#!/usr/bin/env python3
+import time
+
+import cereal.messaging as messaging
+
+N_MSGS = 100000
+
+
+def fill(plan, i):
+  plan.vCruise = float(i)
+  plan.aCruise = 1.0
+  plan.vTarget = float(i)
+  plan.aTarget = -1.0
+  plan.hasLead = bool(i % 2)
+  plan.longitudinalPlanSource = 'mpc1'
+
+
+def new_message():
+  for i in range(N_MSGS):
+    dat = messaging.new_message()
+    dat.init('plan')
+    fill(dat.plan, i)
+    dat.to_bytes()
+
+
+def pooled():
+  builder = messaging.MessageBuilder('plan')
+  for i in range(N_MSGS):
+    dat = builder.reset()
+    fill(dat.plan, i)
+    builder.to_bytes()
+
+
+if __name__ == "__main__":
+  for f in [new_message, pooled]:
+    t = time.time()
+    f()
+    dt = time.time() - t
+    print("%-12s %6.2f us/msg" % (f.__name__, dt / N_MSGS * 1e6))
@@ -0,0 +1,85 @@
+import asyncio
+import time
+import unittest
+
+import cereal.messaging as messaging
+import cereal.messaging.aio as aio
+
+
+def run(coro):
+  return asyncio.get_event_loop().run_until_complete(coro)
+
+
+class TestAio(unittest.TestCase):
+  def test_recv(self):
+    pub = messaging.pub_sock('liveCalibration')
+    sub = messaging.sub_sock('liveCalibration')
+    time.sleep(0.1)  # Slow joiner
+
+    async def send_later():
+      await asyncio.sleep(0.05)
+      msg = messaging.new_message()
+      msg.init('liveCalibration')
+      msg.liveCalibration.calStatus = 1
+      pub.send(msg.to_bytes())
+
+    async def recv_both():
+      return (await asyncio.gather(aio.recv_one(sub, timeout=1.), send_later()))[0]
+
+    self.assertEqual(run(recv_both()).liveCalibration.calStatus, 1)
+    self.assertIsNone(run(aio.recv(sub, timeout=0.05)))
+
+  def test_concurrent_waiters(self):
+    pub = messaging.pub_sock('ubloxGnss')
+    sub = messaging.sub_sock('ubloxGnss')
+    time.sleep(0.1)  # Slow joiner
+
+    async def send_later():
+      await asyncio.sleep(0.05)
+      msg = messaging.new_message()
+      msg.init('ubloxGnss')
+      pub.send(msg.to_bytes())
+
+    # every waiter on a socket wakes up, not only the last one that started waiting
+    async def wait_both():
+      t = time.time()
+      await asyncio.gather(aio.wait_readable([sub], 1.), aio.wait_readable([sub], 1.), send_later())
+      return time.time() - t
+
+    self.assertLess(run(wait_both()), 0.5)
+    self.assertIsNotNone(messaging.recv_one(sub))
+
+  def test_submaster(self):
+    pub_trigger = messaging.pub_sock('pathPlan')
+    pub_other = messaging.pub_sock('liveParameters')
+    sm = aio.AsyncSubMaster(['pathPlan', 'liveParameters'])
+    time.sleep(0.1)  # Slow joiner
+
+    def send(pub, s):
+      msg = messaging.new_message()
+      msg.init(s)
+      pub.send(msg.to_bytes())
+
+    send(pub_other, 'liveParameters')
+    t = time.time()
+    run(sm.update(200, wait_for='pathPlan'))
+    self.assertGreater(time.time() - t, 0.15)
+    self.assertEqual(sm.updated, {'pathPlan': False, 'liveParameters': True})
+
+    async def send_later():
+      await asyncio.sleep(0.05)
+      send(pub_other, 'liveParameters')
+      await asyncio.sleep(0.05)
+      send(pub_trigger, 'pathPlan')
+
+    async def update():
+      await asyncio.gather(sm.update(1000, wait_for='pathPlan'), send_later())
+
+    t = time.time()
+    run(update())
+    self.assertLess(time.time() - t, 0.5)
+    self.assertEqual(sm.updated, {'pathPlan': True, 'liveParameters': True})
+
+
+if __name__ == "__main__":
+  unittest.main()
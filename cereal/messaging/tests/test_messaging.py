@@ -0,0 +1,212 @@
+import os
+import sys
+import random
+import subprocess
+import unittest
+import time
+import cereal.messaging as messaging
+from cereal import log
+from cereal.services import service_list
+
+
+class TestMessaging(unittest.TestCase):
+  def test_zero_copy_receive(self):
+    pub = messaging.pub_sock('controlsState')
+    sub = messaging.sub_sock('controlsState')
+    time.sleep(0.1)  # Slow joiner
+
+    msg = messaging.new_message()
+    msg.init('controlsState')
+    msg.controlsState.vEgo = 12.5
+    dat = msg.to_bytes()
+    pub.send(dat)
+
+    buf = sub.receive(copy=False)
+    self.assertIsInstance(buf, messaging.MessageBuffer)
+    self.assertEqual(len(buf), len(dat))
+    self.assertEqual(bytes(memoryview(buf)), dat)
+    self.assertEqual(buf.tobytes(), dat)
+
+  def test_zero_copy_helpers(self):
+    pub = messaging.pub_sock('plan')
+    sub = messaging.sub_sock('plan', timeout=1000)
+    time.sleep(0.1)  # Slow joiner
+
+    for i in range(3):
+      msg = messaging.new_message()
+      msg.init('plan')
+      msg.plan.vTarget = i
+      pub.send(msg.to_bytes())
+    time.sleep(0.1)
+
+    first = messaging.recv_one(sub, zero_copy=True)
+    rest = messaging.drain_sock(sub, zero_copy=True)
+    self.assertEqual([m.plan.vTarget for m in [first] + rest], [0, 1, 2])
+    self.assertIsNone(messaging.recv_one_or_none(sub, zero_copy=True))
+
+  def test_submaster_zero_copy(self):
+    pub = messaging.pub_sock('liveParameters')
+    sm = messaging.SubMaster(['liveParameters'], zero_copy=True)
+    time.sleep(0.1)  # Slow joiner
+
+    msg = messaging.new_message()
+    msg.init('liveParameters')
+    msg.liveParameters.steerRatio = 3.0
+    pub.send(msg.to_bytes())
+
+    sm.update(1000)
+    self.assertTrue(sm.updated['liveParameters'])
+
+    # data outlives the receive it came from
+    sm.update(0)
+    self.assertEqual(sm['liveParameters'].steerRatio, 3.0)
+
+  def test_submaster_wait_for(self):
+    pub_trigger = messaging.pub_sock('model')
+    pub_other = messaging.pub_sock('carState')
+    sm = messaging.SubMaster(['model', 'carState'])
+    time.sleep(0.1)  # Slow joiner
+
+    def send(pub, s):
+      msg = messaging.new_message()
+      msg.init(s)
+      pub.send(msg.to_bytes())
+
+    # non trigger messages don't wake up update, they get folded in after the timeout
+    send(pub_other, 'carState')
+    t = time.time()
+    sm.update(200, wait_for='model')
+    self.assertGreater(time.time() - t, 0.15)
+    self.assertEqual(sm.updated, {'model': False, 'carState': True})
+
+    send(pub_other, 'carState')
+    send(pub_trigger, 'model')
+    t = time.time()
+    sm.update(1000, wait_for=['model'])
+    self.assertLess(time.time() - t, 0.15)
+    self.assertEqual(sm.updated, {'model': True, 'carState': True})
+
+  def test_pubmaster_send_many(self):
+    pm = messaging.PubMaster(['pathPlan', 'liveMpc'])
+    sm = messaging.SubMaster(['pathPlan', 'liveMpc'])
+    time.sleep(0.1)  # Slow joiner
+
+    path_plan = messaging.new_message()
+    path_plan.init('pathPlan')
+    path_plan.pathPlan.laneWidth = 1.0
+    live_mpc = messaging.new_message()
+    live_mpc.init('liveMpc')
+    live_mpc.liveMpc.cost = 2.0
+    pm.send_many([('pathPlan', path_plan), ('liveMpc', live_mpc.to_bytes())])
+
+    sm.update(1000, wait_for=['pathPlan', 'liveMpc'])
+    if not all(sm.updated.values()):
+      sm.update(1000)
+    self.assertEqual(sm['pathPlan'].laneWidth, 1.0)
+    self.assertEqual(sm['liveMpc'].cost, 2.0)
+    self.assertGreater(pm.serialize_time['pathPlan'], 0.)
+    self.assertEqual(pm.serialize_time['liveMpc'], 0.)
+    self.assertGreater(pm.send_time['liveMpc'], 0.)
+
+  def test_message_builder(self):
+    builder = messaging.MessageBuilder('plan')
+    dat = builder.reset()
+    dat.plan.vTarget = 1.0
+    first = log.Event.from_bytes(builder.to_bytes())
+
+    self.assertIs(builder.reset(), dat)
+    dat.plan.vTarget = 2.0
+    second = log.Event.from_bytes(builder.to_bytes())
+    self.assertEqual((first.plan.vTarget, second.plan.vTarget), (1.0, 2.0))
+    self.assertTrue(second.valid)
+    self.assertGreater(second.logMonoTime, 0)
+
+    # orphaned list data grows the message until it gets reallocated
+    builder = messaging.MessageBuilder('pathPlan')
+    for i in range(20):
+      dat = builder.reset()
+      dat.pathPlan.dPoly = [float(i)] * 50
+      self.assertEqual(log.Event.from_bytes(builder.to_bytes()).pathPlan.dPoly[0], i)
+      self.assertLessEqual(builder.last_size, 3 * builder.base_size)
+
+    builder = messaging.MessageBuilder('carEvents', 2)
+    self.assertEqual(len(builder.reset().carEvents), 2)
+    self.assertEqual(len(builder.reset(3).carEvents), 3)
+
+  def test_stats(self):
+    pub = messaging.pub_sock('thermal')
+    sub = messaging.sub_sock('thermal', timeout=1000)
+    sub_conflate = messaging.sub_sock('thermal', conflate=True, timeout=1000)
+    sub_latest = messaging.sub_sock('thermal', timeout=1000)
+    stats = messaging.enable_stats(interval=0.)
+    stats_sock = messaging.sub_sock('messagingStats', timeout=1000)
+    time.sleep(0.1)  # Slow joiner
+
+    try:
+      for _ in range(5):
+        msg = messaging.new_message()
+        msg.init('thermal')
+        pub.send(msg.to_bytes())
+      time.sleep(0.1)
+
+      self.assertIsNotNone(messaging.recv_one(sub))
+      self.assertEqual(len(messaging.drain_sock(sub)), 4)
+      self.assertIsNotNone(messaging.recv_sock(sub_conflate))
+      self.assertEqual(messaging.recv_sock(sub_latest).logMonoTime, msg.logMonoTime)
+
+      # receiving doesn't publish, update does
+      self.assertIsNone(messaging.recv_one_or_none(stats_sock))
+      stats.update()
+      report = messaging.recv_one(stats_sock)
+    finally:
+      messaging.stats = None
+
+    # stats are kept per socket
+    st, st_latest, st_conflate = sorted(report.messagingStats.sockets, key=lambda s: (s.received, s.maxQueueDepth),
+                                        reverse=True)
+    self.assertEqual({st.service, st_latest.service, st_conflate.service}, {'thermal'})
+    self.assertEqual((st.received, st_latest.received, st_conflate.received), (5, 1, 1))
+    self.assertEqual((st.maxQueueDepth, st_latest.maxQueueDepth, st_conflate.maxQueueDepth), (4, 5, 1))
+    # recv_sock threw away the 4 older messages, conflate drops before the socket so those aren't seen
+    self.assertEqual((st.dropped, st_latest.dropped, st_conflate.dropped), (0, 4, 0))
+    self.assertEqual(len(st.latencies), 2)
+    self.assertGreater(min(st.latencies), 0.)
+
+    # the report resets the per interval stats
+    self.assertEqual(len(stats.report().messagingStats.sockets[0].latencies), 0)
+
+  def test_import_with_stats_env(self):
+    # stats are only enabled by calling enable_stats, not by the environment
+    env = dict(os.environ, MESSAGING_STATS="1")
+    out = subprocess.check_output([sys.executable, "-c", "import cereal.messaging as m; print(m.stats)"], env=env)
+    self.assertEqual(out.decode().strip(), "None")
+
+  def test_submaster_alive(self):
+    services = ['controlsState', 'carState', 'plan', 'liveCalibration', 'gpsLocation']
+    sm = messaging.SubMaster(services, ignore_alive=['gpsLocation'], addr=None)
+    self.assertFalse(sm.all_alive())
+
+    random.seed(0)
+    rcv_time = {s: 0. for s in services}
+    cur_time = 100.
+    for _ in range(2000):
+      cur_time += random.uniform(0, 0.5)
+      msgs = []
+      for s in random.sample(services, random.randint(0, 2)):
+        msg = messaging.new_message()
+        msg.init(s)
+        msg.valid = random.random() > 0.1
+        msgs.append(msg)
+        rcv_time[s] = cur_time
+      sm.update_msgs(cur_time, msgs)
+
+      alive = {s: (cur_time - rcv_time[s]) < (10. / service_list[s].frequency) for s in services}
+      self.assertEqual(sm.alive, alive)
+      self.assertEqual(sm.updated, {s: any(m.which() == s for m in msgs) for s in services})
+      self.assertEqual(sm.all_alive(), all(alive[s] for s in services if s != 'gpsLocation'))
+      self.assertEqual(sm.all_valid(), all(sm.valid.values()))
+      self.assertEqual(sm.all_alive_and_valid(['carState']), alive['carState'] and sm.valid['carState'])
+
+
+if __name__ == "__main__":
+  unittest.main()
@@ -0,0 +1,80 @@
+import random
+import unittest
+
+import cereal.messaging as messaging
+from cereal import log
+from cereal.messaging.projection import Projection
+
+
+def read(evt, path):
+  try:
+    for name in path.split("."):
+      evt = getattr(evt, name)
+    return evt
+  except Exception:  # pylint: disable=broad-except
+    return None
+
+
+class TestProjection(unittest.TestCase):
+  PATHS = ["logMonoTime", "valid", "controlsState.vEgo", "controlsState.enabled", "controlsState.state",
+           "controlsState.canErrorCounter", "controlsState.lateralControlState.pidState.p",
+           "controlsState.lateralControlState.lqrState.i", "carState.vEgo", "carState.gearShifter",
+           "carState.cruiseState.speed", "health.voltage", "controlsState.alertText1"]
+
+  def _random_msgs(self, n):
+    random.seed(0)
+    msgs = []
+    for i in range(n):
+      msg = messaging.new_message()
+      msg.valid = random.random() > 0.5
+      if i % 3 == 0:
+        msg.init('controlsState')
+        msg.controlsState.vEgo = random.uniform(-50, 50)
+        msg.controlsState.enabled = random.random() > 0.5
+        msg.controlsState.state = random.choice(['disabled', 'enabled', 'softDisabling'])
+        msg.controlsState.canErrorCounter = random.randint(0, 2**32 - 1)
+        msg.controlsState.alertText1 = "alert %d" % i
+        if random.random() > 0.5:
+          msg.controlsState.lateralControlState.init('pidState')
+          msg.controlsState.lateralControlState.pidState.p = random.uniform(-1, 1)
+        else:
+          msg.controlsState.lateralControlState.init('lqrState')
+          msg.controlsState.lateralControlState.lqrState.i = random.uniform(-1, 1)
+      elif i % 3 == 1:
+        msg.init('carState')
+        msg.carState.vEgo = random.uniform(0, 50)
+        msg.carState.gearShifter = random.choice(['park', 'drive', 'reverse'])
+        # big lists push later structs into other segments, behind far pointers
+        if random.random() > 0.5:
+          msg.carState.init('buttonEvents', 5000)
+        msg.carState.cruiseState.speed = random.uniform(0, 50)
+      else:
+        msg.init('health')
+        msg.health.voltage = random.randint(0, 20000)
+      msgs.append(msg.to_bytes())
+    return msgs
+
+  def test_projection(self):
+    proj = Projection(self.PATHS)
+    for dat in self._random_msgs(300):
+      evt = log.Event.from_bytes(dat)
+      self.assertEqual(proj.which(dat), evt.which())
+
+      for path, val in zip(self.PATHS, proj(memoryview(dat))):
+        expected = read(evt, path)
+        if isinstance(val, float):
+          self.assertAlmostEqual(val, expected, places=5, msg=path)
+        elif expected is None or isinstance(expected, (bool, int, float, str)):
+          self.assertEqual(val, expected, msg=path)
+        else:
+          self.assertEqual(str(val), str(expected), msg=path)
+
+  def test_log_mono_time_only(self):
+    proj = Projection(["logMonoTime"])
+    msg = messaging.new_message()
+    msg.init('can', 10)
+    self.assertEqual(proj(msg.to_bytes()), [msg.logMonoTime])
+
+
+if __name__ == "__main__":
+  unittest.main()
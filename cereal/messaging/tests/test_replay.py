@@ -0,0 +1,86 @@
+import bz2
+import os
+import shutil
+import tempfile
+import time
+import unittest
+
+import cereal.messaging as messaging
+import cereal.messaging.replay as replay
+from cereal.messaging.replay import Segment, SegmentPublisher, segment_sub_sock
+
+
+class TestReplay(unittest.TestCase):
+  def setUp(self):
+    self.tmpdir = tempfile.mkdtemp()
+    self.replay_dir = replay.REPLAY_DIR
+    replay.REPLAY_DIR = os.path.join(self.tmpdir, "replay")
+    self.msgs = []
+    for i in range(20):
+      msg = messaging.new_message()
+      if i % 2:
+        msg.init('clocks')
+        msg.clocks.bootTimeNanos = i
+      else:
+        msg.init('procLog')
+        msg.procLog.init('procs', i)
+      msg.logMonoTime = i
+      self.msgs.append(msg.to_bytes())
+
+    self.fn = os.path.join(self.tmpdir, "rlog.bz2")
+    with open(self.fn, "wb") as f:
+      f.write(bz2.compress(b"".join(self.msgs)))
+
+  def tearDown(self):
+    replay.REPLAY_DIR = self.replay_dir
+    shutil.rmtree(self.tmpdir)
+
+  def test_index(self):
+    seg = Segment(self.fn)
+    # nothing is written next to the log
+    self.assertEqual(sorted(os.listdir(self.tmpdir)), ["replay", "rlog.bz2"])
+    self.assertTrue(seg.fn.startswith(replay.REPLAY_DIR))
+    self.assertEqual(len(seg), len(self.msgs))
+    for i, (offset, size, which, log_mono_time) in enumerate(seg.index):
+      self.assertEqual(bytes(seg.data(offset, size)), self.msgs[i])
+      self.assertEqual(which, 'clocks' if i % 2 else 'procLog')
+      self.assertEqual(log_mono_time, i)
+      self.assertEqual(seg[i].which(), which)
+    self.assertEqual([m.logMonoTime for m in seg], list(range(20)))
+
+  def test_saved_index(self):
+    index = Segment(self.fn).index
+
+    # later segments load the saved index instead of indexing again
+    index_events = replay.index_events
+    replay.index_events = None
+    try:
+      self.assertEqual(Segment(self.fn).index, index)
+    finally:
+      replay.index_events = index_events
+
+    seg = Segment(self.fn)
+    seg.remove_cache()
+    self.assertEqual(os.listdir(replay.REPLAY_DIR), [])
+
+  def test_publish(self):
+    seg = Segment(self.fn)
+    pub = SegmentPublisher(seg)
+    sub = segment_sub_sock(seg, 'clocks', timeout=1000)
+    time.sleep(0.1)  # Slow joiner
+
+    pub.replay()
+    time.sleep(0.1)
+    msgs = messaging.drain_sock(sub)
+    self.assertEqual([m.clocks.bootTimeNanos for m in msgs], list(range(1, 20, 2)))
+
+    # events are copied unless asked not to
+    pub.publish(1)
+    pub.publish(3)
+    time.sleep(0.1)
+    self.assertEqual(sub.receive(), self.msgs[1])
+    self.assertIsInstance(sub.receive(copy=False), memoryview)
+
+
+if __name__ == "__main__":
+  unittest.main()
@@ -1,21 +1,79 @@
+from bisect import bisect_left
+
+import numpy as np
+
 def int_rnd(x):
   return int(round(x))
 
 def clip(x, lo, hi):
   return max(lo, min(hi, x))
 
+def _interp(xv, xp, fp):
+  # first breakpoint >= xv, xp must be increasing
+  hi = bisect_left(xp, xv)
+  if hi == 0:
+    return fp[0]
+  if hi == len(xp):
+    return fp[-1]
+  low = hi - 1
+  return (xv - xp[low]) * (fp[hi] - fp[low]) / (xp[hi] - xp[low]) + fp[low]
+
+def _interp_array(x, xp, fp):
+  # vectorized _interp, same operations in the same order so every element matches bit for bit
+  x = np.asarray(x, dtype=np.float64)
+  xp = np.asarray(xp, dtype=np.float64)
+  fp = np.asarray(fp, dtype=np.float64)
+  n = len(xp)
+  if n == 1:
+    return [float(fp[0])] * len(x)
+
+  hi = np.searchsorted(xp, x, side='left')
+  # bisect_left puts NaN before the first breakpoint, searchsorted after the last
+  hi[np.isnan(x)] = 0
+  upper = np.clip(hi, 1, n - 1)
+  low = upper - 1
+  with np.errstate(divide='ignore', invalid='ignore'):
+    ret = (x - xp[low]) * (fp[upper] - fp[low]) / (xp[upper] - xp[low]) + fp[low]
+  ret[hi == 0] = fp[0]
+  ret[hi == n] = fp[-1]
+  return ret.tolist()
+
 def interp(x, xp, fp):
-  N = len(xp)
-  def get_interp(xv):
-    hi = 0
-    while hi < N and xv > xp[hi]:
-      hi += 1
+  if isinstance(x, float):
+    return _interp(x, xp, fp)
+  if isinstance(x, np.ndarray):
+    return _interp_array(x, xp, fp)
+  return [_interp(v, xp, fp) for v in x] if hasattr(
+    x, '__iter__') else _interp(x, xp, fp)
+
+class InterpTable():
+  """interp with fixed breakpoints: InterpTable(xp, fp)(x) == interp(x, xp, fp).
+  The table is copied into tuples once, so capnp lists and arrays aren't indexed on every call."""
+  def __init__(self, xp, fp):
+    self.xp = tuple(float(v) for v in xp)
+    self.fp = tuple(float(v) for v in fp)
+    assert len(self.xp) == len(self.fp) and len(self.xp) > 0
+    self.lo = self.fp[0]
+    self.hi = self.fp[-1]
+    self.n = len(self.xp)
+    self.dfp = tuple(self.fp[i + 1] - self.fp[i] for i in range(self.n - 1))
+    self.dxp = tuple(self.xp[i + 1] - self.xp[i] for i in range(self.n - 1))
+    self.xp_array = np.array(self.xp)
+    self.fp_array = np.array(self.fp)
+
+  def __call__(self, x):
+    if isinstance(x, np.ndarray):
+      return _interp_array(x, self.xp_array, self.fp_array)
+    if hasattr(x, '__iter__'):
+      return [self(v) for v in x]
+
+    hi = bisect_left(self.xp, x)
+    if hi == 0:
+      return self.lo
+    if hi == self.n:
+      return self.hi
     low = hi - 1
-    return fp[-1] if hi == N and xv > xp[low] else (
-      fp[0] if hi == 0 else
-      (xv - xp[low]) * (fp[hi] - fp[low]) / (xp[hi] - xp[low]) + fp[low])
-  return [get_interp(v) for v in x] if hasattr(
-    x, '__iter__') else get_interp(x)
+    return (x - self.xp[low]) * self.dfp[low] / self.dxp[low] + self.fp[low]
 
 def mean(x):
   return sum(x) / len(x)
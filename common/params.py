@@ -19,6 +19,14 @@ before deleting the old <params_dir>/<d> directory.
 
 Writers that only modify a single key can simply take the lock, then swap the corresponding value
 file in place without messing with <params_dir>/d.
+
+Params.get() serves values from a process local cache. The cache watches <params_dir> and <params_dir>/d
+with inotify and drops values when their file changes, blocking gets sleep until a value is written.
+Without inotify every get reads the file, and blocking gets poll.
+
+Reads across processes are only eventually consistent. A write by another process is seen once the watch thread
+has handled its inotify event, until then get() can still return the old value. Writes made through the same
+process' Params are seen right away.
 """
 import time
 import os
@@ -27,8 +35,13 @@ import sys
 import shutil
 import fcntl
 import tempfile
+import struct
+import atexit
 import threading
 from enum import Enum
+from cffi import FFI
+
+from selfdrive.swaglog import cloudlog
 
 
 def mkdirs_exists_ok(path):
@@ -39,6 +52,26 @@ def mkdirs_exists_ok(path):
       raise
 
 
+ffi = FFI()
+ffi.cdef("""
+int inotify_init1(int flags);
+int inotify_add_watch(int fd, const char *pathname, uint32_t mask);
+""")
+libc = ffi.dlopen(None)
+
+IN_MODIFY = 0x2
+IN_CLOSE_WRITE = 0x8
+IN_MOVED_FROM = 0x40
+IN_MOVED_TO = 0x80
+IN_CREATE = 0x100
+IN_DELETE = 0x200
+IN_Q_OVERFLOW = 0x4000
+IN_ONLYDIR = 0x1000000
+IN_CLOEXEC = 0o2000000
+
+INOTIFY_EVENT = struct.Struct("iIII")
+
+
 class TxType(Enum):
   PERSISTENT = 1
   CLEAR_ON_MANAGER_START = 2
@@ -297,27 +330,222 @@ def read_db(params_path, key):
     return None
 
 def write_db(params_path, key, value):
-  if isinstance(value, str):
-    value = value.encode('utf8')
+  write_db_many(params_path, {key: value})
 
+def write_db_many(params_path, vals):
+  """Writes several keys with one lock acquisition and one fsync of the data directory"""
   prev_umask = os.umask(0)
   lock = FileLock(params_path+"/.lock", True)
   lock.acquire()
 
   try:
-    tmp_path = tempfile.mktemp(prefix=".tmp", dir=params_path)
-    with open(tmp_path, "wb") as f:
-      f.write(value)
-      f.flush()
-      os.fsync(f.fileno())
-
-    path = "%s/d/%s" % (params_path, key)
-    os.rename(tmp_path, path)
-    fsync_dir(os.path.dirname(path))
+    for key, value in vals.items():
+      if isinstance(value, str):
+        value = value.encode('utf8')
+
+      tmp_path = tempfile.mktemp(prefix=".tmp", dir=params_path)
+      with open(tmp_path, "wb") as f:
+        f.write(value)
+        f.flush()
+        os.fsync(f.fileno())
+
+      os.rename(tmp_path, "%s/d/%s" % (params_path, key))
+    fsync_dir("%s/d" % params_path)
   finally:
     os.umask(prev_umask)
     lock.release()
 
+class ParamsCache():
+  """Values of the keys read so far, kept up to date by a thread that reads inotify events.
+
+  Every change bumps a generation counter. Readers only store what they read if the generation didn't change
+  in the meantime, so a value that was read while it was being replaced is never cached.
+  """
+  DATA_MASK = IN_MODIFY | IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | IN_DELETE
+  DIR_MASK = IN_MOVED_TO | IN_CREATE | IN_DELETE
+
+  def __init__(self, db):
+    self.db = db
+    self.pid = os.getpid()
+    self.vals = {}
+    self.generation = 0
+    self.changed = threading.Condition()
+
+    try:
+      self.fd = libc.inotify_init1(IN_CLOEXEC)
+    except AttributeError:
+      # no inotify on this platform
+      self.fd = -1
+    if self.fd < 0:
+      return
+
+    self.dir_wd = libc.inotify_add_watch(self.fd, self.db.encode('utf8'), self.DIR_MASK | IN_ONLYDIR)
+    self.data_wd = self._watch_data()
+    if self.dir_wd < 0 or self.data_wd < 0:
+      os.close(self.fd)
+      self.fd = -1
+      return
+
+    threading.Thread(target=self._watch_thread, daemon=True).start()
+
+  @property
+  def enabled(self):
+    return self.fd >= 0
+
+  def _watch_data(self):
+    # follows the symlink, so this watches the directory d currently points to
+    return libc.inotify_add_watch(self.fd, (self.db + "/d").encode('utf8'), self.DATA_MASK | IN_ONLYDIR)
+
+  def _watch_thread(self):
+    while True:
+      buf = os.read(self.fd, 4096)
+      for wd, mask, name in self._parse_events(buf):
+        if wd == self.dir_wd and name == "d":
+          # d was swapped for a new directory by a transaction. Watch the new directory before dropping the
+          # values, so no change in it can go unnoticed.
+          self.data_wd = self._watch_data()
+          self.invalidate()
+        elif wd == self.data_wd:
+          self.invalidate(name)
+        elif mask & IN_Q_OVERFLOW:
+          self.invalidate()
+
+  @staticmethod
+  def _parse_events(buf):
+    offset = 0
+    while offset < len(buf):
+      wd, mask, _, name_len = INOTIFY_EVENT.unpack_from(buf, offset)
+      offset += INOTIFY_EVENT.size
+      name = buf[offset:offset + name_len].rstrip(b"\0").decode('utf8', 'replace')
+      offset += name_len
+      yield wd, mask, name
+
+  def invalidate(self, key=None):
+    """Drops the value of key, or of all keys if key is None, and wakes up blocking gets"""
+    with self.changed:
+      if key is None:
+        self.vals.clear()
+      else:
+        self.vals.pop(key, None)
+      self.generation += 1
+      self.changed.notify_all()
+
+  def get(self, key):
+    """Returns (value, generation), the value is read from disk if it isn't cached"""
+    generation = self.generation
+    try:
+      return self.vals[key], generation
+    except KeyError:
+      pass
+
+    ret = read_db(self.db, key)
+    with self.changed:
+      if self.generation == generation:
+        self.vals[key] = ret
+    return ret, generation
+
+  def wait(self, generation, timeout):
+    """Waits until something changed since generation, or timeout seconds have passed"""
+    with self.changed:
+      if self.generation == generation:
+        self.changed.wait(timeout)
+
+
+class ParamsWriter():
+  """Writes params from one background thread. Repeated puts of a key before it is written only write the last
+  value, and everything queued while a batch is written goes into the next batch.
+
+  write_lock is held while writing a batch, synchronous writes take it too, so writes from this process land
+  on disk in the order they were made.
+  """
+  def __init__(self, db):
+    self.db = db
+    self.pid = os.getpid()
+    self.pending = {}
+    self.writing = {}
+    self.changed = threading.Condition()
+    self.write_lock = threading.Lock()
+    self.thread = None
+
+  def put(self, key, dat):
+    with self.changed:
+      self.pending[key] = dat
+      if self.thread is None:
+        self.thread = threading.Thread(target=self._writer_thread, daemon=True)
+        self.thread.start()
+      self.changed.notify_all()
+
+  def discard(self, keys):
+    """Drops queued writes of keys, callers should hold write_lock"""
+    with self.changed:
+      for key in keys:
+        self.pending.pop(key, None)
+      self.changed.notify_all()
+
+  def queued(self, key):
+    """Returns the value of key that is queued or being written, None if there is none"""
+    ret = self.pending.get(key)
+    return ret if ret is not None else self.writing.get(key)
+
+  def flush(self, timeout=None):
+    """Waits until everything queued so far is written, returns False on timeout"""
+    with self.changed:
+      return self.changed.wait_for(lambda: not self.pending and not self.writing, timeout)
+
+  def _writer_thread(self):
+    cache = params_cache(self.db)
+    while True:
+      with self.changed:
+        self.changed.wait_for(lambda: self.pending)
+
+      with self.write_lock:
+        with self.changed:
+          vals = self.writing = self.pending
+          self.pending = {}
+
+        try:
+          if len(vals):
+            write_db_many(self.db, vals)
+        except Exception:  # pylint: disable=broad-except
+          cloudlog.exception("failed to write params")
+        finally:
+          for key in vals:
+            cache.invalidate(key)
+          with self.changed:
+            self.writing = {}
+            self.changed.notify_all()
+
+
+_caches = {}
+_writers = {}
+_caches_lock = threading.Lock()
+
+
+def params_cache(db):
+  """Returns the cache of db for this process, a forked child gets its own since the watch thread isn't forked"""
+  with _caches_lock:
+    cache = _caches.get(db)
+    if cache is None or cache.pid != os.getpid():
+      cache = _caches[db] = ParamsCache(db)
+    return cache
+
+
+def params_writer(db):
+  """Returns the writer of db for this process, like params_cache"""
+  with _caches_lock:
+    writer = _writers.get(db)
+    if writer is None or writer.pid != os.getpid():
+      writer = _writers[db] = ParamsWriter(db)
+    return writer
+
+
+@atexit.register
+def _flush_writers():
+  for writer in list(_writers.values()):
+    if writer.pid == os.getpid():
+      writer.flush()
+
+
 class Params():
   def __init__(self, db='/data/params'):
     self.db = db
@@ -327,6 +555,9 @@ class Params():
       with self.transaction(write=True):
         pass
 
+    self.cache = params_cache(self.db)
+    self.writer = params_writer(self.db)
+
   def transaction(self, write=False):
     if write:
       return DBWriter(self.db)
@@ -334,10 +565,13 @@ class Params():
       return DBReader(self.db)
 
   def _clear_keys_with_type(self, tx_type):
-    with self.transaction(write=True) as txn:
-      for key in keys:
-        if tx_type in keys[key]:
+    cleared = [key for key in keys if tx_type in keys[key]]
+    with self.writer.write_lock:
+      self.writer.discard(cleared)
+      with self.transaction(write=True) as txn:
+        for key in cleared:
           txn.delete(key)
+    self.cache.invalidate()
 
   def manager_start(self):
     self._clear_keys_with_type(TxType.CLEAR_ON_MANAGER_START)
@@ -346,19 +580,31 @@ class Params():
     self._clear_keys_with_type(TxType.CLEAR_ON_PANDA_DISCONNECT)
 
   def delete(self, key):
-    with self.transaction(write=True) as txn:
-      txn.delete(key)
+    with self.writer.write_lock:
+      self.writer.discard([key])
+      with self.transaction(write=True) as txn:
+        txn.delete(key)
+    self.cache.invalidate()
 
   def get(self, key, block=False, encoding=None):
     if key not in keys:
       raise UnknownKeyName(key)
 
-    while 1:
-      ret = read_db(self.db, key)
+    # a queued write is the newest value
+    ret = self.writer.queued(key)
+    while ret is None:
+      if self.cache.enabled:
+        ret, generation = self.cache.get(key)
+      else:
+        ret = read_db(self.db, key)
       if not block or ret is not None:
         break
-      # is polling really the best we can do?
-      time.sleep(0.05)
+
+      if self.cache.enabled:
+        # wake up on the next write, the timeout only guards against missed events
+        self.cache.wait(generation, 1.)
+      else:
+        time.sleep(0.05)
 
     if ret is not None and encoding is not None:
       ret = ret.decode(encoding)
@@ -377,17 +623,29 @@ class Params():
     if key not in keys:
       raise UnknownKeyName(key)
 
-    write_db(self.db, key, dat)
+    with self.writer.write_lock:
+      self.writer.discard([key])
+      write_db(self.db, key, dat)
+    # don't wait for the inotify event, gets right after this put must see the new value
+    self.cache.invalidate(key)
 
+  def put_nonblocking(self, key, dat):
+    """Queues the write for the writer thread of this process, see ParamsWriter"""
+    if key not in keys:
+      raise UnknownKeyName(key)
 
-def put_nonblocking(key, val):
-  def f(key, val):
-    params = Params()
-    params.put(key, val)
+    if isinstance(dat, str):
+      dat = dat.encode('utf8')
+    self.writer.put(key, dat)
 
-  t = threading.Thread(target=f, args=(key, val))
-  t.start()
-  return t
+  def flush(self, timeout=None):
+    """Waits until all queued writes are on disk. Queued writes are also flushed at a normal exit, but are lost
+    when the process is killed by a signal, like manager stops its processes. Use put for values that must land."""
+    return self.writer.flush(timeout)
+
+
+def put_nonblocking(key, val):
+  Params().put_nonblocking(key, val)
 
 
 if __name__ == "__main__":
@@ -1,46 +1,151 @@
-import time
+"""Hierarchical profiler.
+
+  prof = Profiler(enabled=True, publish=True)
+  with prof.span("loop"):
+    with prof.span("sample"):
+      ...
+
+Spans nest, a span opened inside another is named "loop/sample". Every span keeps its last `window` durations,
+summaries give the count, p50, p99 and max of each span. Timing uses sec_since_boot. A disabled profiler
+hands out one shared span that does nothing, so leaving the spans in hot loops costs a method call each.
+
+Every interval seconds, at the end of a top level span, the summaries are printed. With publish=True they are
+sent on the profile service instead. Only one process can publish profile at a time, others fall back to printing.
+Spans that are open while the profiler is reset are dropped.
+"""
+import os
+import multiprocessing
+from collections import deque
+
+import numpy as np
+
+from common.realtime import sec_since_boot
+from selfdrive.swaglog import cloudlog
+
+
+class _NullSpan():
+  def __enter__(self):
+    return self
+
+  def __exit__(self, *args):
+    pass
+
+NULL_SPAN = _NullSpan()
+
+
+class _Span():
+  __slots__ = ('profiler', 'name')
+
+  def __init__(self, profiler, name):
+    self.profiler = profiler
+    self.name = name
+
+  def __enter__(self):
+    self.profiler.start(self.name)
+    return self
+
+  def __exit__(self, *args):
+    self.profiler.stop()
+
 
 class Profiler():
-  def __init__(self, enabled=False):
+  def __init__(self, enabled=False, window=1000, publish=False, interval=1.):
     self.enabled = enabled
-    self.cp = {}
-    self.cp_ignored = []
-    self.iter = 0
-    self.start_time = time.time()
-    self.last_time = self.start_time
-    self.tot = 0.
+    self.window = window
+    self.interval = interval
+    self.process_name = multiprocessing.current_process().name
+    self.sock = None
+    self.reset(enabled)
+
+    if enabled and publish:
+      from cereal.messaging import pub_sock, MultiplePublishersError
+      try:
+        self.sock = pub_sock('profile')
+      except MultiplePublishersError:
+        cloudlog.warning("profile is already published by another process, printing summaries instead")
 
   def reset(self, enabled=False):
     self.enabled = enabled
-    self.cp = {}
-    self.cp_ignored = []
-    self.iter = 0
-    self.start_time = time.time()
-    self.last_time = self.start_time
-
-  def checkpoint(self, name, ignore=False):
-    # ignore flag needed when benchmarking threads with ratekeeper
+    self.spans = {}
+    self.paths = {}
+    self.durations = {}
+    self.counts = {}
+    self.stack = []
+    self.last_report = sec_since_boot()
+
+  def span(self, name):
+    """Context manager that times the code in it as a child of the span it is opened in"""
     if not self.enabled:
+      return NULL_SPAN
+    span = self.spans.get(name)
+    if span is None:
+      span = self.spans[name] = _Span(self, name)
+    return span
+
+  def start(self, name):
+    parent = self.stack[-1][0] if len(self.stack) else None
+    path = self.paths.get((parent, name))
+    if path is None:
+      path = self.paths[(parent, name)] = name if parent is None else parent + "/" + name
+      self.durations[path] = deque(maxlen=self.window)
+      self.counts[path] = 0
+    self.stack.append((path, sec_since_boot()))
+
+  def stop(self):
+    if len(self.stack) == 0:
+      # the span was opened before a reset
       return
-    tt = time.time()
-    if name not in self.cp:
-      self.cp[name] = 0.
-      if ignore:
-        self.cp_ignored.append(name)
-    self.cp[name] += tt - self.last_time
-    if not ignore:
-      self.tot += tt - self.last_time
-    self.last_time = tt
+    path, start_time = self.stack.pop()
+    t = sec_since_boot()
+    self.durations[path].append(t - start_time)
+    self.counts[path] += 1
+
+    if len(self.stack) == 0 and t - self.last_report > self.interval:
+      if self.sock is not None:
+        self.report()
+      else:
+        self.display()
+      self.last_report = t
+
+  def summary(self):
+    """Returns (name, count since the last report or display, p50, p99, max) of every span, durations in seconds"""
+    ret = []
+    for path, durations in self.durations.items():
+      if len(durations) == 0:
+        continue
+      p50, p99 = np.percentile(durations, [50, 99])
+      ret.append((path, self.counts[path], float(p50), float(p99), max(durations)))
+    return ret
+
+  def report(self):
+    from cereal.messaging import new_message
+    spans = self.summary()
+
+    dat = new_message()
+    dat.init('profile')
+    dat.profile.pid = os.getpid()
+    dat.profile.process = self.process_name
+    dat_spans = dat.profile.init('spans', len(spans))
+    for i, (name, count, p50, p99, max_t) in enumerate(spans):
+      dat_spans[i].name = name
+      dat_spans[i].count = count
+      dat_spans[i].p50 = p50
+      dat_spans[i].p99 = p99
+      dat_spans[i].max = max_t
+    self._reset_counts()
+
+    if self.sock is not None:
+      self.sock.send(dat.to_bytes())
+    return dat
 
   def display(self):
     if not self.enabled:
       return
-    self.iter += 1
     print("******* Profiling *******")
-    for n, ms in sorted(self.cp.items(), key=lambda x: -x[1]):
-      if n in self.cp_ignored:
-        print("%30s: %7.2f   percent: %3.0f   IGNORED" % (n, ms*1000.0, ms/self.tot*100))
-      else:
-        print("%30s: %7.2f   percent: %3.0f" % (n, ms*1000.0, ms/self.tot*100))
-    print("Iter clock: %2.6f   TOTAL: %2.2f" % (self.tot/self.iter, self.tot))
+    for name, count, p50, p99, max_t in sorted(self.summary()):
+      print("%40s: %6d   p50: %7.3f ms   p99: %7.3f ms   max: %7.3f ms" % (name, count, p50*1e3, p99*1e3, max_t*1e3))
+    self._reset_counts()
 
+  def _reset_counts(self):
+    for path in self.counts:
+      self.counts[path] = 0
@@ -4,6 +4,7 @@ import time
 import platform
 import subprocess
 import multiprocessing
+from collections import deque
 from cffi import FFI
 
 from common.common_pyx import sec_since_boot  # pylint: disable=no-name-in-module, import-error
@@ -37,15 +38,35 @@ def set_realtime_priority(level):
 
 
 class Ratekeeper():
-  def __init__(self, rate, print_delay_threshold=0.):
-    """Rate in Hz for ratekeeping. print_delay_threshold must be nonnegative."""
+  def __init__(self, rate, print_delay_threshold=0., spin_time=0., catch_up='burst', window=100):
+    """Rate in Hz for ratekeeping. print_delay_threshold must be nonnegative.
+
+    keep_time() sleeps until spin_time seconds before the deadline and busy waits the rest, which trades
+    CPU for less wake up jitter than sleep alone. The busy wait holds the GIL, other threads of the process,
+    like the params writer behind put_nonblocking, only get to run when the interpreter forces a switch
+    (sys.getswitchinterval(), 5 ms by default). Keep spin_time well below that in processes that use them.
+
+    catch_up decides what happens after running late by more than one interval. 'burst' runs the missed
+    frames back to back until the loop is on schedule again, 'skip' drops them and keeps going from the
+    current frame, at most one frame runs late.
+    """
+    assert catch_up in ('burst', 'skip')
     self._interval = 1. / rate
     self._next_frame_time = sec_since_boot() + self._interval
     self._print_delay_threshold = print_delay_threshold
+    self._spin_time = spin_time
+    self._catch_up = catch_up
     self._frame = 0
     self._remaining = 0
     self._process_name = multiprocessing.current_process().name
 
+    # over the last window frames: how late past its deadline keep_time returned,
+    # and how far behind its deadline monitor_time was called
+    self._lateness = deque(maxlen=window)
+    self._lag = deque(maxlen=window)
+    self._overruns = 0
+    self._skipped = 0
+
   @property
   def frame(self):
     return self._frame
@@ -54,21 +75,77 @@ class Ratekeeper():
   def remaining(self):
     return self._remaining
 
+  @property
+  def overruns(self):
+    """Calls to keep_time or monitor_time that came after the deadline of their frame, before any sleep"""
+    return self._overruns
+
+  @property
+  def skipped(self):
+    """Frames dropped by the 'skip' catch up policy"""
+    return self._skipped
+
+  def stats(self):
+    """Frame, overrun and skipped frame counts. Over the last frames, in seconds, lateness_* is how late
+    keep_time returned and lag_* how far behind schedule monitor_time was called"""
+    ret = {
+      'frames': self._frame,
+      'overruns': self._overruns,
+      'skipped': self._skipped,
+    }
+    ret.update(self._percentiles('lateness', self._lateness))
+    ret.update(self._percentiles('lag', self._lag))
+    return ret
+
+  @staticmethod
+  def _percentiles(name, samples):
+    samples = sorted(samples)
+    n = len(samples)
+    return {
+      name + '_mean': sum(samples) / n if n else 0.,
+      name + '_p50': samples[n // 2] if n else 0.,
+      name + '_p99': samples[min(n - 1, int(n * 0.99))] if n else 0.,
+      name + '_max': samples[-1] if n else 0.,
+    }
+
   # Maintain loop rate by calling this at the end of each loop
   def keep_time(self):
-    lagged = self.monitor_time()
+    deadline = self._next_frame_time
+    lagged = self._update(False)
     if self._remaining > 0:
-      time.sleep(self._remaining)
+      self._sleep_until(deadline)
+    self._lateness.append(max(sec_since_boot() - deadline, 0.))
     return lagged
 
   # this only monitor the cumulative lag, but does not enforce a rate
   def monitor_time(self):
+    return self._update(True)
+
+  def _sleep_until(self, deadline):
+    remaining = deadline - sec_since_boot()
+    if remaining > self._spin_time:
+      time.sleep(remaining - self._spin_time)
+    while sec_since_boot() < deadline:
+      pass
+
+  def _update(self, record_lag):
     lagged = False
     remaining = self._next_frame_time - sec_since_boot()
     self._next_frame_time += self._interval
+    if record_lag:
+      self._lag.append(max(-remaining, 0.))
+
     if self._print_delay_threshold is not None and remaining < -self._print_delay_threshold:
       print("%s lagging by %.2f ms" % (self._process_name, -remaining * 1000))
       lagged = True
+
+    if remaining < 0:
+      self._overruns += 1
+      if self._catch_up == 'skip' and remaining < -self._interval:
+        missed = int(-remaining / self._interval)
+        self._next_frame_time += missed * self._interval
+        remaining += missed * self._interval
+        self._skipped += missed
     self._frame += 1
     self._remaining = remaining
     return lagged
@@ -0,0 +1,66 @@
+#!/usr/bin/env python3
+import time
+import random
+
+import numpy as np
+
+from common.numpy_fast import interp, InterpTable
+
+N_CALLS = 100000
+TABLE_SIZES = [2, 5, 10]
+ARRAY_SIZE = 100
+
+
+def interp_linear_scan(x, xp, fp):
+  # common.numpy_fast.interp before the bisect lookup, for comparison
+  N = len(xp)
+  def get_interp(xv):
+    hi = 0
+    while hi < N and xv > xp[hi]:
+      hi += 1
+    low = hi - 1
+    return fp[-1] if hi == N and xv > xp[low] else (
+      fp[0] if hi == 0 else
+      (xv - xp[low]) * (fp[hi] - fp[low]) / (xp[hi] - xp[low]) + fp[low])
+  return [get_interp(v) for v in x] if hasattr(
+    x, '__iter__') else get_interp(x)
+
+
+def check(f, xs, reference):
+  # a faster interp is only worth something if it gives the same results
+  for x in xs:
+    assert f(x) == reference(x), "results differ from the linear scan for %r" % (x,)
+
+
+def bench(f, xs):
+  t = time.time()
+  for x in xs:
+    f(x)
+  return (time.time() - t) / len(xs) * 1e6
+
+
+if __name__ == "__main__":
+  for n in TABLE_SIZES:
+    xp = [float(i) * 5. for i in range(n)]
+    fp = [random.uniform(-1., 1.) for _ in range(n)]
+    xp_np, fp_np = np.array(xp), np.array(fp)
+    table = InterpTable(xp, fp)
+    # speeds in the table and a bit outside of it
+    xs = [random.uniform(-5., xp[-1] + 5.) for _ in range(N_CALLS)]
+    check(lambda x: interp(x, xp, fp), xs, lambda x: interp_linear_scan(x, xp, fp))
+    check(table, xs, lambda x: interp_linear_scan(x, xp, fp))
+
+    print("%d breakpoints, scalar" % n)
+    print("  %-14s %6.2f us" % ("linear scan", bench(lambda x: interp_linear_scan(x, xp, fp), xs)))
+    print("  %-14s %6.2f us" % ("interp", bench(lambda x: interp(x, xp, fp), xs)))
+    print("  %-14s %6.2f us" % ("InterpTable", bench(table, xs)))
+    print("  %-14s %6.2f us" % ("np.interp", bench(lambda x: np.interp(x, xp_np, fp_np), xs)))
+
+    arrays = [np.random.uniform(-5., xp[-1] + 5., ARRAY_SIZE) for _ in range(N_CALLS // ARRAY_SIZE)]
+    check(lambda x: interp(x, xp, fp), arrays, lambda x: interp_linear_scan(x, xp, fp))
+    check(table, arrays, lambda x: interp_linear_scan(x, xp, fp))
+    print("%d breakpoints, %d element arrays" % (n, ARRAY_SIZE))
+    print("  %-14s %6.2f us" % ("linear scan", bench(lambda x: interp_linear_scan(x, xp, fp), arrays)))
+    print("  %-14s %6.2f us" % ("interp", bench(lambda x: interp(x, xp, fp), arrays)))
+    print("  %-14s %6.2f us" % ("InterpTable", bench(table, arrays)))
+    print("  %-14s %6.2f us" % ("np.interp", bench(lambda x: np.interp(x, xp_np, fp_np), arrays)))
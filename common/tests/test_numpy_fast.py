@@ -0,0 +1,90 @@
+#!/usr/bin/env python3
+import random
+import unittest
+
+import numpy as np
+
+from common.numpy_fast import interp, InterpTable
+
+
+def interp_linear_scan(x, xp, fp):
+  # common.numpy_fast.interp before the bisect lookup, the reference for the results
+  N = len(xp)
+  def get_interp(xv):
+    hi = 0
+    while hi < N and xv > xp[hi]:
+      hi += 1
+    low = hi - 1
+    return fp[-1] if hi == N and xv > xp[low] else (
+      fp[0] if hi == 0 else
+      (xv - xp[low]) * (fp[hi] - fp[low]) / (xp[hi] - xp[low]) + fp[low])
+  return [get_interp(v) for v in x] if hasattr(
+    x, '__iter__') else get_interp(x)
+
+
+TABLES = [
+  ([0.], [3.]),
+  ([0., 10.], [1., -1.]),
+  ([0., 5., 10., 20., 35.], [0.3, 0.2, 0.15, 0.1, 0.05]),
+  ([0, 10, 20], [5, 0, 100]),  # ints
+  ([0., 5., 5., 10.], [0., 1., 2., 3.]),  # duplicate breakpoints
+  ([0., 5., 5., 5., 10., 10.], [0., 1., 2., 3., 4., 5.]),
+]
+
+
+class TestInterp(unittest.TestCase):
+  def _xs(self, xp):
+    random.seed(0)
+    lo, hi = xp[0] - 5., xp[-1] + 5.
+    # every breakpoint, right around them, and random points in and outside the table
+    xs = [float(v) for v in xp] + [np.nextafter(float(v), lo) for v in xp] + [np.nextafter(float(v), hi) for v in xp]
+    xs += [lo, hi] + [random.uniform(lo, hi) for _ in range(1000)]
+    return xs
+
+  def assertSameResults(self, a, b):
+    self.assertEqual(len(a), len(b))
+    for va, vb in zip(a, b):
+      self.assertEqual(va, vb)
+
+  def test_scalars(self):
+    for xp, fp in TABLES:
+      table = InterpTable(xp, fp)
+      for x in self._xs(xp):
+        expected = interp_linear_scan(x, xp, fp)
+        self.assertEqual(interp(x, xp, fp), expected, (x, xp, fp))
+        self.assertEqual(table(x), expected, (x, xp, fp))
+
+  def test_ints(self):
+    for xp, fp in TABLES:
+      table = InterpTable(xp, fp)
+      for x in range(int(xp[0]) - 5, int(xp[-1]) + 6):
+        expected = interp_linear_scan(x, xp, fp)
+        self.assertEqual(interp(x, xp, fp), expected, (x, xp, fp))
+        self.assertEqual(table(x), expected, (x, xp, fp))
+
+  def test_lists_and_arrays(self):
+    for xp, fp in TABLES:
+      table = InterpTable(xp, fp)
+      xs = self._xs(xp)
+      expected = interp_linear_scan(xs, xp, fp)
+      for x in [xs, tuple(xs), np.array(xs)]:
+        self.assertSameResults(interp(x, xp, fp), expected)
+        self.assertSameResults(table(x), expected)
+      # breakpoints given as arrays
+      self.assertSameResults(interp(np.array(xs), np.array(xp), np.array(fp)), expected)
+
+      xs_int = np.arange(int(xp[0]) - 5, int(xp[-1]) + 6)
+      self.assertSameResults(interp(xs_int, xp, fp), interp_linear_scan(xs_int, xp, fp))
+
+  def test_nan(self):
+    xp, fp = TABLES[2]
+    xs = [1., float('nan'), 40.]
+    expected = interp_linear_scan(xs, xp, fp)
+    self.assertEqual(expected[1], fp[0])
+    self.assertSameResults(interp(xs, xp, fp), expected)
+    self.assertSameResults(interp(np.array(xs), xp, fp), expected)
+    self.assertSameResults(InterpTable(xp, fp)(np.array(xs)), expected)
+
+
+if __name__ == "__main__":
+  unittest.main()
@@ -0,0 +1,176 @@
+#!/usr/bin/env python3
+import os
+import sys
+import time
+import subprocess
+import shutil
+import tempfile
+import threading
+import unittest
+import multiprocessing
+
+import common.params
+from common.basedir import BASEDIR
+from common.params import Params, read_db, write_db
+
+
+def _put(db, key, dat):
+  Params(db).put(key, dat)
+
+
+def _manager_start(db):
+  Params(db).manager_start()
+
+
+def _wait_for(f, timeout=2.):
+  t = time.time()
+  while time.time() - t < timeout:
+    if f():
+      return True
+    time.sleep(0.01)
+  return False
+
+
+class TestParamsCache(unittest.TestCase):
+  def setUp(self):
+    self.tmpdir = tempfile.mkdtemp()
+    self.params = Params(self.tmpdir)
+    self.assertTrue(self.params.cache.enabled)
+
+  def tearDown(self):
+    shutil.rmtree(self.tmpdir)
+
+  def _put_other_process(self, key, dat):
+    p = multiprocessing.Process(target=_put, args=(self.tmpdir, key, dat))
+    p.start()
+    p.join()
+    self.assertEqual(p.exitcode, 0)
+
+  def test_other_process_write(self):
+    self.params.put("DongleId", b"old")
+    self.assertEqual(self.params.get("DongleId"), b"old")
+    self.assertEqual(self.params.cache.vals["DongleId"], b"old")
+
+    # the cached value is dropped once the inotify event of the other process' write comes in
+    self._put_other_process("DongleId", b"new")
+    self.assertTrue(_wait_for(lambda: self.params.get("DongleId") == b"new"))
+
+  def test_block_wakes_on_put(self):
+    ret = []
+    t = threading.Thread(target=lambda: ret.append(self.params.get("DongleId", block=True)))
+    t.start()
+    time.sleep(0.1)
+
+    # written without going through this process' Params, so only inotify can wake up the get
+    start = time.time()
+    write_db(self.tmpdir, "DongleId", b"abc")
+    t.join(2.)
+    self.assertEqual(ret, [b"abc"])
+    # faster than the 1 s timeout that guards against missed events
+    self.assertLess(time.time() - start, 0.5)
+
+  def test_symlink_swap(self):
+    self.params.put("DongleId", b"old")
+    self.assertEqual(self.params.get("DongleId"), b"old")
+
+    # a transaction writes a new directory and swaps d over to it
+    old_d = os.readlink(os.path.join(self.tmpdir, "d"))
+    with self.params.transaction(write=True) as txn:
+      txn.put("DongleId", b"new")
+    self.assertNotEqual(os.readlink(os.path.join(self.tmpdir, "d")), old_d)
+    self.assertTrue(_wait_for(lambda: self.params.get("DongleId") == b"new"))
+
+    # the new directory is watched
+    self.assertEqual(self.params.get("IsMetric"), None)
+    write_db(self.tmpdir, "IsMetric", b"1")
+    self.assertTrue(_wait_for(lambda: self.params.get("IsMetric") == b"1"))
+
+  def test_manager_start(self):
+    self.params.put("CarParams", b"cp")
+    self.params.put("DongleId", b"id")
+    self.assertEqual(self.params.get("CarParams"), b"cp")
+
+    self.params.manager_start()
+    self.assertIsNone(self.params.get("CarParams"))
+    self.assertEqual(self.params.get("DongleId"), b"id")
+
+    # a clear by another process reaches this cache too
+    self.params.put("CarParams", b"cp")
+    self.assertEqual(self.params.get("CarParams"), b"cp")
+    p = multiprocessing.Process(target=_manager_start, args=(self.tmpdir,))
+    p.start()
+    p.join()
+    self.assertTrue(_wait_for(lambda: self.params.get("CarParams") is None))
+
+
+class TestParamsWriter(unittest.TestCase):
+  def setUp(self):
+    self.tmpdir = tempfile.mkdtemp()
+    self.params = Params(self.tmpdir)
+    self.batches = []
+
+    write_db_many = common.params.write_db_many
+    def record_batch(db, vals):
+      self.batches.append(dict(vals))
+      time.sleep(self.write_delay)
+      write_db_many(db, vals)
+    self.write_delay = 0.
+    common.params.write_db_many = record_batch
+    self.addCleanup(setattr, common.params, "write_db_many", write_db_many)
+
+  def tearDown(self):
+    self.params.flush()
+    shutil.rmtree(self.tmpdir)
+
+  def test_coalesce(self):
+    # the writer thread can't start a batch while write_lock is held, so all of these are queued together
+    with self.params.writer.write_lock:
+      for i in range(3):
+        self.params.put_nonblocking("DongleId", str(i))
+      self.params.put_nonblocking("IsMetric", "1")
+      # queued values are returned before they are written
+      self.assertEqual(self.params.get("DongleId"), b"2")
+      self.assertFalse(self.params.flush(0.1))
+
+    self.assertTrue(self.params.flush(1.))
+    self.assertEqual(self.batches, [{"DongleId": b"2", "IsMetric": b"1"}])
+    self.assertEqual(read_db(self.tmpdir, "DongleId"), b"2")
+    self.assertEqual(read_db(self.tmpdir, "IsMetric"), b"1")
+
+  def test_flush(self):
+    self.write_delay = 0.1
+    self.params.put_nonblocking("DongleId", "abc")
+    self.assertTrue(self.params.flush(1.))
+    self.assertEqual(read_db(self.tmpdir, "DongleId"), b"abc")
+
+  def test_flush_at_exit(self):
+    code = "from common.params import Params; Params(%r).put_nonblocking('DongleId', 'abc')" % self.tmpdir
+    subprocess.check_call([sys.executable, "-c", code], env=dict(os.environ, PYTHONPATH=BASEDIR))
+    self.assertEqual(read_db(self.tmpdir, "DongleId"), b"abc")
+
+  def test_ordering(self):
+    # a synchronous put waits for the batch that is being written, then overwrites it
+    self.write_delay = 0.2
+    self.params.put_nonblocking("DongleId", "queued")
+    time.sleep(0.05)
+    self.assertEqual(len(self.batches), 1)
+    self.params.put("DongleId", b"sync")
+    self.assertEqual(read_db(self.tmpdir, "DongleId"), b"sync")
+
+    # and drops writes that are still queued
+    self.write_delay = 0.
+    with self.params.writer.write_lock:
+      self.params.put_nonblocking("DongleId", "queued")
+    self.params.put("DongleId", b"sync2")
+    self.params.flush()
+    self.assertEqual(read_db(self.tmpdir, "DongleId"), b"sync2")
+
+    with self.params.writer.write_lock:
+      self.params.put_nonblocking("DongleId", "queued")
+    self.params.delete("DongleId")
+    self.params.flush()
+    self.assertIsNone(self.params.get("DongleId"))
+
+
+if __name__ == "__main__":
+  unittest.main()
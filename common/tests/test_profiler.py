@@ -0,0 +1,88 @@
+#!/usr/bin/env python3
+import unittest
+
+import common.profiler
+from common.profiler import NULL_SPAN, Profiler
+
+
+class TestProfiler(unittest.TestCase):
+  def setUp(self):
+    # every call of the clock advances it by one ms
+    self.t = 0.
+    def clock():
+      self.t += 1e-3
+      return self.t
+    sec_since_boot = common.profiler.sec_since_boot
+    common.profiler.sec_since_boot = clock
+    self.addCleanup(setattr, common.profiler, "sec_since_boot", sec_since_boot)
+
+  def _summary(self, prof):
+    return {name: (count, p50, p99, max_t) for name, count, p50, p99, max_t in prof.summary()}
+
+  def test_nesting(self):
+    prof = Profiler(True, interval=1e9)
+    for _ in range(2):
+      with prof.span("loop"):
+        with prof.span("sample"):
+          pass
+        with prof.span("control"):
+          with prof.span("sample"):
+            pass
+
+    summary = self._summary(prof)
+    self.assertEqual(set(summary.keys()), {"loop", "loop/sample", "loop/control", "loop/control/sample"})
+    self.assertEqual(summary["loop/sample"][0], 2)
+    self.assertAlmostEqual(summary["loop/sample"][3], 1e-3)
+    self.assertAlmostEqual(summary["loop/control"][3], 3e-3)
+    self.assertAlmostEqual(summary["loop"][3], 7e-3)
+
+  def test_window(self):
+    prof = Profiler(True, window=10, interval=1e9)
+    # durations of 1 to 20 ms, only the last 10 are kept
+    for i in range(1, 21):
+      with prof.span("x"):
+        self.t += (i - 1) * 1e-3
+
+    count, p50, p99, max_t = self._summary(prof)["x"]
+    self.assertEqual(count, 20)
+    self.assertAlmostEqual(p50, 15.5e-3)
+    self.assertAlmostEqual(p99, 19.91e-3)
+    self.assertAlmostEqual(max_t, 20e-3)
+
+  def test_report_resets_counts(self):
+    prof = Profiler(True, interval=1e9)
+    for _ in range(3):
+      with prof.span("x"):
+        pass
+
+    span, = prof.report().profile.spans
+    self.assertEqual((span.name, span.count), ("x", 3))
+    # durations are kept, counts start over
+    count, _, _, max_t = self._summary(prof)["x"]
+    self.assertEqual(count, 0)
+    self.assertAlmostEqual(max_t, 1e-3)
+
+  def test_disabled(self):
+    prof = Profiler(False)
+    self.assertIs(prof.span("x"), NULL_SPAN)
+    with prof.span("x"):
+      with prof.span("y"):
+        pass
+    self.assertEqual(prof.summary(), [])
+
+  def test_reset_with_open_spans(self):
+    prof = Profiler(True, interval=1e9)
+    with prof.span("outer"):
+      with prof.span("inner"):
+        prof.reset(True)
+      with prof.span("after"):
+        pass
+    self.assertEqual(list(self._summary(prof).keys()), ["after"])
+
+    with prof.span("outer"):
+      prof.reset(False)
+    self.assertEqual(prof.summary(), [])
+
+
+if __name__ == "__main__":
+  unittest.main()
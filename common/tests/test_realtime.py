@@ -0,0 +1,100 @@
+#!/usr/bin/env python3
+import unittest
+from types import SimpleNamespace
+
+import common.realtime
+from common.realtime import Ratekeeper
+
+
+class FakeClock():
+  def __init__(self):
+    self.t = 100.
+
+  def __call__(self):
+    return self.t
+
+  def sleep(self, dt):
+    self.t += dt
+
+
+class TestRatekeeper(unittest.TestCase):
+  def setUp(self):
+    self.clock = FakeClock()
+    for name, fake in (("sec_since_boot", self.clock), ("time", SimpleNamespace(sleep=self.clock.sleep))):
+      orig = getattr(common.realtime, name)
+      setattr(common.realtime, name, fake)
+      self.addCleanup(setattr, common.realtime, name, orig)
+
+  def test_on_time(self):
+    rk = Ratekeeper(100, print_delay_threshold=None)
+    for _ in range(10):
+      self.clock.t += 0.004
+      rk.keep_time()
+    self.assertAlmostEqual(self.clock.t, 100.1)
+    stats = rk.stats()
+    self.assertEqual((stats['frames'], stats['overruns'], stats['skipped']), (10, 0, 0))
+    self.assertEqual(stats['lateness_max'], 0.)
+    self.assertEqual(stats['lag_max'], 0.)
+
+  def test_burst(self):
+    rk = Ratekeeper(100, print_delay_threshold=None)
+    # the first frame takes 3.5 intervals, the next ones run back to back until the loop is back on schedule
+    self.clock.t += 0.035
+    rk.keep_time()
+    self.assertAlmostEqual(rk.remaining, -0.025)
+    rk.keep_time()
+    rk.keep_time()
+    self.assertEqual(rk.overruns, 3)
+    rk.keep_time()
+    self.assertAlmostEqual(rk.remaining, 0.005)
+    self.assertAlmostEqual(self.clock.t, 100.04)
+    self.assertEqual((rk.frame, rk.overruns, rk.skipped), (4, 3, 0))
+
+  def test_skip(self):
+    rk = Ratekeeper(100, print_delay_threshold=None, catch_up='skip')
+    # 2.5 intervals late, the two whole missed frames are dropped and the loop is only late for the current one
+    self.clock.t += 0.035
+    rk.keep_time()
+    self.assertAlmostEqual(rk.remaining, -0.005)
+    self.assertEqual((rk.frame, rk.overruns, rk.skipped), (1, 1, 2))
+    rk.keep_time()
+    self.assertAlmostEqual(rk.remaining, 0.005)
+    self.assertAlmostEqual(self.clock.t, 100.04)
+    self.assertEqual((rk.frame, rk.overruns, rk.skipped), (2, 1, 2))
+
+    # less than one interval late doesn't skip anything
+    self.clock.t += 0.015
+    rk.keep_time()
+    self.assertEqual((rk.frame, rk.overruns, rk.skipped), (3, 2, 2))
+
+  def test_lateness(self):
+    rk = Ratekeeper(100, print_delay_threshold=None, window=100)
+    # frame i ends i / 10 ms after its deadline
+    for i in range(99):
+      self.clock.t = 100. + (i + 1) * 0.01 + i * 1e-4
+      rk.keep_time()
+    stats = rk.stats()
+    self.assertAlmostEqual(stats['lateness_mean'], 49 * 1e-4)
+    self.assertAlmostEqual(stats['lateness_p50'], 49 * 1e-4)
+    self.assertAlmostEqual(stats['lateness_p99'], 98 * 1e-4)
+    self.assertAlmostEqual(stats['lateness_max'], 98 * 1e-4)
+    # keep_time doesn't add to monitor_time's lag
+    self.assertEqual(stats['lag_max'], 0.)
+
+  def test_lag(self):
+    rk = Ratekeeper(100, print_delay_threshold=None, window=4)
+    for i, lag in enumerate((0., 0.001, 0.002, 0.003, 0.004)):
+      self.clock.t = 100. + (i + 1) * 0.01 + lag
+      rk.monitor_time()
+    stats = rk.stats()
+    # only the last window frames are kept
+    self.assertAlmostEqual(stats['lag_mean'], 0.0025)
+    self.assertAlmostEqual(stats['lag_p50'], 0.003)
+    self.assertAlmostEqual(stats['lag_max'], 0.004)
+    # monitor_time doesn't add to keep_time's lateness
+    self.assertEqual(stats['lateness_max'], 0.)
+    self.assertEqual(stats['overruns'], 4)
+
+
+if __name__ == "__main__":
+  unittest.main()
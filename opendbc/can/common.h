@@ -27,8 +27,13 @@ public:
   std::vector<Signal> parse_sigs;
   std::vector<double> vals;
 
+  // (index in parse_sigs, slot in CANParser::slot_values) for requested signals
+  std::vector<std::pair<int, int>> slots;
+
   uint16_t ts;
   uint64_t seen;
+  // CANParser::update_count of the update_string call that last parsed this message
+  uint64_t seen_update;
   uint64_t check_threshold;
 
   uint8_t counter;
@@ -48,14 +53,37 @@ private:
 public:
   bool can_valid = false;
   uint64_t last_sec = 0;
+  // number of update_string calls so far
+  uint64_t update_count = 0;
+
+  // latest value and logMonoTime of each requested signal, indexed in the order of sigoptions
+  std::vector<double> slot_values;
+  std::vector<uint64_t> slot_ts;
+
+  // optional ring buffers with the last history_size samples of each slot, stored as [slot][i]
+  // history_count is the total number of samples written to each slot
+  size_t history_size = 0;
+  std::vector<double> history_values;
+  std::vector<uint64_t> history_ts;
+  std::vector<uint64_t> history_count;
 
   CANParser(int abus, const std::string& dbc_name,
             const std::vector<MessageParseOptions> &options,
-            const std::vector<SignalParseOptions> &sigoptions);
+            const std::vector<SignalParseOptions> &sigoptions,
+            size_t ahistory_size = 0);
   void UpdateCans(uint64_t sec, const capnp::List<cereal::CanData>::Reader& cans);
   void UpdateValid(uint64_t sec);
   void update_string(std::string data, bool sendcan);
   std::vector<SignalValue> query_latest();
+  std::vector<SignalValue> query_since(uint64_t first_update);
+};
+
+// one message for CANPacker::pack_many, packed on top of base
+struct MessagePackValue {
+  uint32_t address;
+  uint64_t base;
+  int counter;
+  std::vector<SignalPackValue> signals;
 };
 
 class CANPacker {
@@ -67,4 +95,6 @@ private:
 public:
   CANPacker(const std::string& dbc_name);
   uint64_t pack(uint32_t address, const std::vector<SignalPackValue> &signals, int counter);
+  uint64_t pack(uint32_t address, uint64_t base, const std::vector<SignalPackValue> &signals, int counter);
+  std::vector<uint64_t> pack_many(const std::vector<MessagePackValue> &msgs);
 };
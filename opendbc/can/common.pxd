@@ -73,10 +73,27 @@ cdef extern from "common.h":
 
   cdef cppclass CANParser:
     bool can_valid
-    CANParser(int, string, vector[MessageParseOptions], vector[SignalParseOptions])
+    uint64_t last_sec
+    uint64_t update_count
+    vector[double] slot_values
+    vector[uint64_t] slot_ts
+    size_t history_size
+    vector[double] history_values
+    vector[uint64_t] history_ts
+    vector[uint64_t] history_count
+    CANParser(int, string, vector[MessageParseOptions], vector[SignalParseOptions], size_t)
     void update_string(string, bool)
     vector[SignalValue] query_latest()
+    vector[SignalValue] query_since(uint64_t)
+
+  cdef struct MessagePackValue:
+    uint32_t address
+    uint64_t base
+    int counter
+    vector[SignalPackValue] signals
 
   cdef cppclass CANPacker:
    CANPacker(string)
    uint64_t pack(uint32_t, vector[SignalPackValue], int counter)
+   uint64_t pack(uint32_t, uint64_t, vector[SignalPackValue], int counter)
+   vector[uint64_t] pack_many(vector[MessagePackValue])
@@ -2,9 +2,13 @@ import re
 import os
 import struct
 import sys
+import marshal
+import hashlib
 import numbers
 from collections import namedtuple, defaultdict
 
+import numpy as np
+
 def int_or_float(s):
   # return number, trying to maintain int format
   if s.isdigit():
@@ -16,14 +20,80 @@ DBCSignal = namedtuple(
   "DBCSignal", ["name", "start_bit", "size", "is_little_endian", "is_signed",
                 "factor", "offset", "tmin", "tmax", "units"])
 
+# Precomputed extraction parameters of a signal, see dbc.compile_signal.
+#   shift is the bit offset within the 64 bit word (big endian word for big endian signals).
+#   mask is the unshifted value mask, ((1 << size) - 1).
+#   sign is the value subtracted from negative raw values, 0 for unsigned signals.
+#   word_mask is the shifted mask in the big endian word, used for encoding.
+SignalPlan = namedtuple(
+  "SignalPlan", ["name", "is_little_endian", "shift", "mask", "sign", "factor", "offset", "word_mask"])
+
+# bump when the parsed representation changes to invalidate existing caches
+DBC_CACHE_VERSION = 2
+
 
 class dbc():
-  def __init__(self, fn):
+  def __init__(self, fn, use_cache=True):
     self.name, _ = os.path.splitext(os.path.basename(fn))
     with open(fn, encoding="ascii") as f:
       self.txt = f.readlines()
     self._warned_addresses = set()
 
+    # lookup to bit reverse each byte
+    self.bits_index = [(i & ~0b111) + ((-i-1) & 0b111) for i in range(64)]
+
+    # parsed msgs and def_vals are cached next to the dbc, keyed by a hash of its contents. The cache only
+    # holds plain tuples, lists and dicts in marshal format, loading it never runs code.
+    self.cache_fn = os.path.join(os.path.dirname(fn), "." + os.path.basename(fn) + ".cache")
+    self.cache_key = "%d-%s" % (DBC_CACHE_VERSION, hashlib.sha1("".join(self.txt).encode("ascii")).hexdigest())
+
+    if not (use_cache and self.load_cache()):
+      self.parse()
+      if use_cache:
+        self.save_cache()
+
+    self.msg_name_to_address = {}
+    for address, m in self.msgs.items():
+      name = m[0][0]
+      self.msg_name_to_address[name] = address
+
+    # A dictionary which maps message ids to tuples of SignalPlan, built once
+    # so encode and decode don't have to redo the bit arithmetic per call.
+    self.plans = {address: tuple(self.compile_signal(s) for s in m[1]) for address, m in self.msgs.items()}
+    self.signal_plans = {address: {p.name: p for p in plans} for address, plans in self.plans.items()}
+
+  def load_cache(self):
+    try:
+      with open(self.cache_fn, "rb") as f:
+        key, msgs, def_vals = marshal.load(f)
+      if key != self.cache_key:
+        return False
+
+      msgs = {address: (tuple(header), [DBCSignal(*s) for s in signals]) for address, (header, signals) in msgs.items()}
+      def_vals = defaultdict(list, {address: [tuple(v) for v in vals] for address, vals in def_vals.items()})
+    except (OSError, EOFError, ValueError, TypeError, AttributeError):
+      return False
+
+    self.msgs = msgs
+    self.def_vals = def_vals
+    return True
+
+  def save_cache(self):
+    # write to a temp file and rename, so concurrent loaders never see a partial cache
+    tmp_fn = "%s.%d.tmp" % (self.cache_fn, os.getpid())
+    try:
+      with open(tmp_fn, "wb") as f:
+        msgs = {address: (header, [tuple(s) for s in signals]) for address, (header, signals) in self.msgs.items()}
+        marshal.dump((self.cache_key, msgs, dict(self.def_vals)), f)
+      os.rename(tmp_fn, self.cache_fn)
+    except OSError:
+      # read only filesystem, just parse every time
+      try:
+        os.remove(tmp_fn)
+      except OSError:
+        pass
+
+  def parse(self):
     # regexps from https://github.com/ebroecker/canmatrix/blob/master/canmatrix/importdbc.py
     bo_regexp = re.compile(r"^BO\_ (\w+) (\w+) *: (\w+) (\w+)")
     sg_regexp = re.compile(r"^SG\_ (\w+) : (\d+)\|(\d+)@(\d+)([\+|\-]) \(([0-9.+\-eE]+),([0-9.+\-eE]+)\) \[([0-9.+\-eE]+)\|([0-9.+\-eE]+)\] \"(.*)\" (.*)")
@@ -40,9 +110,6 @@ class dbc():
     # A dictionary which maps message ids to a list of tuples (signal name, definition value pairs)
     self.def_vals = defaultdict(list)
 
-    # lookup to bit reverse each byte
-    self.bits_index = [(i & ~0b111) + ((-i-1) & 0b111) for i in range(64)]
-
     for l in self.txt:
       l = l.strip()
 
@@ -110,10 +177,21 @@ class dbc():
     for msg in self.msgs.values():
       msg[1].sort(key=lambda x: x.start_bit)
 
-    self.msg_name_to_address = {}
-    for address, m in self.msgs.items():
-      name = m[0][0]
-      self.msg_name_to_address[name] = address
+  def compile_signal(self, s):
+    if s.is_little_endian:
+      shift = s.start_bit
+    else:
+      b1 = (s.start_bit // 8) * 8 + (-s.start_bit - 1) % 8
+      shift = 64 - (b1 + s.size)
+
+    mask = (1 << s.size) - 1
+    sign = (1 << s.size) if s.is_signed else 0
+
+    word_mask = (mask << shift) & 0xffffffffffffffff if shift >= 0 else 0
+    if s.is_little_endian:
+      word_mask = self.reverse_bytes(word_mask)
+
+    return SignalPlan(s.name, s.is_little_endian, shift, mask, sign, s.factor, s.offset, word_mask)
 
   def lookup_msg_id(self, msg_id):
     if not isinstance(msg_id, numbers.Number):
@@ -139,34 +217,25 @@ class dbc():
     """
     msg_id = self.lookup_msg_id(msg_id)
 
-    msg_def = self.msgs[msg_id]
-    size = msg_def[0][1]
+    size = self.msgs[msg_id][0][1]
 
     result = 0
-    for s in msg_def[1]:
-      ival = dd.get(s.name)
+    for p in self.plans[msg_id]:
+      ival = dd.get(p.name)
       if ival is not None:
 
-        ival = (ival / s.factor) - s.offset
+        ival = (ival / p.factor) - p.offset
         ival = int(round(ival))
 
-        if s.is_signed and ival < 0:
-          ival = (1 << s.size) + ival
+        if p.sign and ival < 0:
+          ival = p.sign + ival
 
-        if s.is_little_endian:
-          shift = s.start_bit
-        else:
-          b1 = (s.start_bit // 8) * 8 + (-s.start_bit - 1) % 8
-          shift = 64 - (b1 + s.size)
+        dat = (ival & p.mask) << p.shift
 
-        mask = ((1 << s.size) - 1) << shift
-        dat = (ival & ((1 << s.size) - 1)) << shift
-
-        if s.is_little_endian:
-          mask = self.reverse_bytes(mask)
+        if p.is_little_endian:
           dat = self.reverse_bytes(dat)
 
-        result &= ~mask
+        result &= ~p.word_mask
         result |= dat
 
     result = struct.pack('>Q', result)
@@ -207,48 +276,101 @@ class dbc():
       print(name)
 
     st = x[2].ljust(8, b'\x00')
-    le, be = None, None
+    le = int.from_bytes(st, 'little')
+    be = int.from_bytes(st, 'big')
 
-    for s in msg[1]:
-      if arr is not None and s[0] not in arr:
+    if arr is None:
+      plans = self.plans[x[0]]
+    else:
+      sig_plans = self.signal_plans[x[0]]
+      plans = [sig_plans.get(sig) for sig in arr]
+
+    for i, p in enumerate(plans):
+      if p is None or p.shift < 0:
         continue
 
-      start_bit = s[1]
-      signal_size = s[2]
-      little_endian = s[3]
-      signed = s[4]
-      factor = s[5]
-      offset = s[6]
-
-      if little_endian:
-        if le is None:
-          le = struct.unpack("<Q", st)[0]
-        tmp = le
-        shift_amount = start_bit
+      tmp = ((le if p.is_little_endian else be) >> p.shift) & p.mask
+      if p.sign and tmp >= (p.sign >> 1):
+        tmp -= p.sign
+
+      tmp = tmp * p.factor + p.offset
+
+      if arr is None:
+        out[p.name] = tmp
       else:
-        if be is None:
-          be = struct.unpack(">Q", st)[0]
-        tmp = be
-        b1 = (start_bit // 8) * 8 + (-start_bit - 1) % 8
-        shift_amount = 64 - (b1 + signal_size)
+        out[i] = tmp
+    return name, out
 
-      if shift_amount < 0:
+  def decode_many(self, addresses, times, data, arr=None):
+    """Decode a batch of CAN messages using the dbc.
+
+       Inputs:
+        addresses: Array of N CAN addresses.
+        times: Array of N bus times.
+        data: The CAN data, either a (N, <=8) uint8 array, a packed buffer of
+              N 8-byte frames, or a sequence of N byte strings of up to 8
+              bytes. Frames shorter than 8 bytes must be passed as an array or
+              a sequence, they are zero padded like in decode.
+        arr: Optional list of signals which should be decoded and returned.
+
+       Returns:
+        A dict mapping message name to a tuple (t, columns), where t is the
+        array of times of that message and columns is a dict mapping signal
+        name to an array of decoded values. Unknown addresses are skipped.
+    """
+    addresses = np.asarray(addresses, dtype=np.uint32)
+    times = np.asarray(times)
+    n = len(addresses)
+
+    if isinstance(data, (bytes, bytearray, memoryview)):
+      if memoryview(data).nbytes != 8 * n:
+        raise ValueError("packed data must be %d 8-byte frames, got %d bytes" % (n, memoryview(data).nbytes))
+      frames = np.frombuffer(data, dtype=np.uint8).reshape(n, 8)
+    elif isinstance(data, np.ndarray):
+      if data.ndim != 2 or data.shape[0] != n or data.shape[1] > 8:
+        raise ValueError("data must be a (%d, <=8) array, got %s" % (n, data.shape))
+      frames = np.zeros((n, 8), dtype=np.uint8)
+      frames[:, :data.shape[1]] = data
+    else:
+      data = [bytes(d) for d in data]
+      if len(data) != n or any(len(d) > 8 for d in data):
+        raise ValueError("data must be %d frames of up to 8 bytes" % n)
+      frames = np.frombuffer(b"".join(d.ljust(8, b'\x00') for d in data), dtype=np.uint8).reshape(n, 8)
+
+    frames = np.ascontiguousarray(frames)
+    dat_le = frames.view('<u8')[:, 0].astype(np.uint64)
+    dat_be = frames.view('>u8')[:, 0].astype(np.uint64)
+
+    # group frames by address, keeping time order within each group
+    order = np.argsort(addresses, kind='stable')
+    uniq, starts = np.unique(addresses[order], return_index=True)
+    ends = np.append(starts[1:], n)
+
+    out = {}
+    for address, start, end in zip(uniq, starts, ends):
+      msg = self.msgs.get(int(address))
+      if msg is None:
+        self._warned_addresses.add(int(address))
         continue
 
-      tmp = (tmp >> shift_amount) & ((1 << signal_size) - 1)
-      if signed and (tmp >> (signal_size - 1)):
-        tmp -= (1 << signal_size)
+      idx = order[start:end]
+      columns = {}
+      for p in self.plans[int(address)]:
+        if (arr is not None and p.name not in arr) or p.shift < 0:
+          continue
 
-      tmp = tmp * factor + offset
+        tmp = (dat_le if p.is_little_endian else dat_be)[idx]
+        tmp = (tmp >> np.uint64(p.shift)) & np.uint64(p.mask)
+        if p.sign:
+          # sign extend in two's complement, move the sign bit to bit 63 and shift back arithmetically.
+          # p.sign doesn't fit in int64 for 63 and 64 bit signals
+          ext = 64 - p.mask.bit_length()
+          tmp = (tmp << np.uint64(ext)).view(np.int64) >> np.int64(ext)
 
-      # if debug:
-      #   print("%40s  %2d %2d  %7.2f %s" % (s[0], s[1], s[2], tmp, s[-1]))
+        columns[p.name] = tmp * p.factor + p.offset
 
-      if arr is None:
-        out[s[0]] = tmp
-      else:
-        out[arr.index(s[0])] = tmp
-    return name, out
+      out[msg[0][0]] = (times[idx], columns)
+    return out
 
   def get_signals(self, msg):
     msg = self.lookup_msg_id(msg)
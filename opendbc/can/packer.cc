@@ -49,7 +49,12 @@ CANPacker::CANPacker(const std::string& dbc_name) {
 }
 
 uint64_t CANPacker::pack(uint32_t address, const std::vector<SignalPackValue> &signals, int counter) {
-  uint64_t ret = 0;
+  return pack(address, 0, signals, counter);
+}
+
+// pack on top of base, a previously packed message. signals not in the list keep their value from base
+uint64_t CANPacker::pack(uint32_t address, uint64_t base, const std::vector<SignalPackValue> &signals, int counter) {
+  uint64_t ret = base;
   for (const auto& sigval : signals) {
     std::string name = std::string(sigval.name);
     double value = sigval.value;
@@ -106,3 +111,12 @@ uint64_t CANPacker::pack(uint32_t address, const std::vector<SignalPackValue> &s
 
   return ret;
 }
+
+std::vector<uint64_t> CANPacker::pack_many(const std::vector<MessagePackValue> &msgs) {
+  std::vector<uint64_t> ret;
+  ret.reserve(msgs.size());
+  for (const auto& msg : msgs) {
+    ret.push_back(pack(msg.address, msg.base, msg.signals, msg.counter));
+  }
+  return ret;
+}
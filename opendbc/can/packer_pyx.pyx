@@ -9,7 +9,13 @@ from libcpp cimport bool
 from posix.dlfcn cimport dlopen, dlsym, RTLD_LAZY
 
 from common cimport CANPacker as cpp_CANPacker
-from common cimport dbc_lookup, SignalPackValue, DBC
+from common cimport dbc_lookup, SignalPackValue, MessagePackValue, DBC
+
+
+cdef class CANTemplate:
+  """A message with its static signals packed, returned by CANPacker.make_template"""
+  cdef readonly int addr
+  cdef readonly uint64_t base
 
 
 cdef class CANPacker:
@@ -29,12 +35,10 @@ cdef class CANPacker:
       self.name_to_address_and_size[string(msg.name)] = (msg.address, msg.size)
       self.address_to_size[msg.address] = msg.size
 
-  cdef uint64_t pack(self, addr, values, counter):
+  cdef vector[SignalPackValue] signal_values(self, values, names):
     cdef vector[SignalPackValue] values_thing
     cdef SignalPackValue spv
 
-    names = []
-
     for name, value in values.iteritems():
       n = name.encode('utf8')
       names.append(n) # TODO: find better way to keep reference to temp string arround
@@ -43,7 +47,11 @@ cdef class CANPacker:
       spv.value = value
       values_thing.push_back(spv)
 
-    return self.packer.pack(addr, values_thing, counter)
+    return values_thing
+
+  cdef uint64_t pack(self, addr, values, counter, uint64_t base=0):
+    names = []
+    return self.packer.pack(addr, base, self.signal_values(values, names), counter)
 
   cdef inline uint64_t ReverseBytes(self, uint64_t x):
     return (((x & 0xff00000000000000ull) >> 56) |
@@ -55,13 +63,60 @@ cdef class CANPacker:
            ((x & 0x000000000000ff00ull) << 40) |
            ((x & 0x00000000000000ffull) << 56))
 
-  cpdef make_can_msg(self, name_or_addr, bus, values, counter=-1):
-    cdef int addr, size
+  cdef (int, int) lookup(self, name_or_addr):
     if type(name_or_addr) == int:
-      addr = name_or_addr
-      size = self.address_to_size[name_or_addr]
+      return name_or_addr, self.address_to_size[name_or_addr]
     else:
-      addr, size = self.name_to_address_and_size[name_or_addr.encode('utf8')]
-    cdef uint64_t val = self.pack(addr, values, counter)
+      return self.name_to_address_and_size[name_or_addr.encode('utf8')]
+
+  cdef uint64_t template_base(self, int addr, template) except? 0:
+    if template is None:
+      return 0
+    if (<CANTemplate?>template).addr != addr:
+      raise ValueError("template is for address %d, not %d" % (template.addr, addr))
+    return (<CANTemplate>template).base
+
+  cpdef make_template(self, name_or_addr, values):
+    """Pre-encodes the static signals of a message. Pass the result as template to make_can_msg,
+    then only the signals that change have to be passed."""
+    cdef int addr, size
+    addr, size = self.lookup(name_or_addr)
+    cdef CANTemplate template = CANTemplate()
+    template.addr = addr
+    template.base = self.pack(addr, values, -1)
+    return template
+
+  cpdef make_can_msg(self, name_or_addr, bus, values, counter=-1, template=None):
+    cdef int addr, size
+    addr, size = self.lookup(name_or_addr)
+
+    cdef uint64_t base = self.template_base(addr, template)
+    cdef uint64_t val = self.pack(addr, values, counter, base)
     val = self.ReverseBytes(val)
     return [addr, 0, (<char *>&val)[:size], bus]
+
+  cpdef pack_many(self, msgs):
+    """Packs a list of (name_or_addr, bus, values[, counter[, template]]) with a single call into the C++ packer"""
+    cdef vector[MessagePackValue] requests
+    cdef MessagePackValue req
+    cdef int addr, size
+    names = []
+    keys = []
+
+    for m in msgs:
+      addr, size = self.lookup(m[0])
+      req.address = addr
+      req.counter = m[3] if len(m) > 3 else -1
+      req.base = self.template_base(addr, m[4] if len(m) > 4 else None)
+      req.signals = self.signal_values(m[2], names)
+      requests.push_back(req)
+      keys.append((addr, size, m[1]))
+
+    cdef vector[uint64_t] vals = self.packer.pack_many(requests)
+    cdef uint64_t val
+    ret = []
+    for i in range(vals.size()):
+      addr, size, bus = keys[i]
+      val = self.ReverseBytes(vals[i])
+      ret.append([addr, 0, (<char *>&val)[:size], bus])
+    return ret
@@ -97,13 +97,24 @@ bool MessageState::update_counter_generic(int64_t v, int cnt_size) {
 
 CANParser::CANParser(int abus, const std::string& dbc_name,
           const std::vector<MessageParseOptions> &options,
-          const std::vector<SignalParseOptions> &sigoptions)
-  : bus(abus) {
+          const std::vector<SignalParseOptions> &sigoptions,
+          size_t ahistory_size)
+  : bus(abus), history_size(ahistory_size) {
 
   dbc = dbc_lookup(dbc_name);
   assert(dbc);
   init_crc_lookup_tables();
 
+  slot_values.resize(sigoptions.size());
+  slot_ts.resize(sigoptions.size());
+  for (int k=0; k<sigoptions.size(); k++) {
+    slot_values[k] = sigoptions[k].default_value;
+  }
+
+  history_values.resize(sigoptions.size() * history_size);
+  history_ts.resize(sigoptions.size() * history_size);
+  history_count.resize(sigoptions.size());
+
   for (const auto& op : options) {
     MessageState state = {
       .address = op.address,
@@ -155,6 +166,17 @@ CANParser::CANParser(int abus, const std::string& dbc_name,
 
     }
 
+    for (int k=0; k<sigoptions.size(); k++) {
+      if (sigoptions[k].address != op.address) continue;
+
+      for (int i=0; i<state.parse_sigs.size(); i++) {
+        if (strcmp(state.parse_sigs[i].name, sigoptions[k].name) == 0) {
+          state.slots.push_back(std::make_pair(i, k));
+          break;
+        }
+      }
+    }
+
     message_states[state.address] = state;
   }
 }
@@ -182,7 +204,21 @@ void CANParser::UpdateCans(uint64_t sec, const capnp::List<cereal::CanData>::Rea
       uint8_t dat[8] = {0};
       memcpy(dat, cmsg.getDat().begin(), cmsg.getDat().size());
 
-      state_it->second.parse(sec, cmsg.getBusTime(), dat);
+      auto& state = state_it->second;
+      if (state.parse(sec, cmsg.getBusTime(), dat)) {
+        state.seen_update = update_count;
+        for (const auto& slot : state.slots) {
+          slot_values[slot.second] = state.vals[slot.first];
+          slot_ts[slot.second] = sec;
+
+          if (history_size > 0) {
+            size_t idx = slot.second * history_size + history_count[slot.second] % history_size;
+            history_values[idx] = state.vals[slot.first];
+            history_ts[idx] = sec;
+            history_count[slot.second]++;
+          }
+        }
+      }
     }
 }
 
@@ -209,6 +245,7 @@ void CANParser::update_string(std::string data, bool sendcan) {
   cereal::Event::Reader event = cmsg.getRoot<cereal::Event>();
 
   last_sec = event.getLogMonoTime();
+  update_count++;
 
   auto cans = sendcan? event.getSendcan() : event.getCan();
   UpdateCans(last_sec, cans);
@@ -218,11 +255,17 @@ void CANParser::update_string(std::string data, bool sendcan) {
 
 
 std::vector<SignalValue> CANParser::query_latest() {
+  return query_since(update_count);
+}
+
+// values of all messages parsed by update_string calls number first_update to update_count,
+// counted by call rather than logMonoTime so strings don't have to be in time order
+std::vector<SignalValue> CANParser::query_since(uint64_t first_update) {
   std::vector<SignalValue> ret;
 
   for (const auto& kv : message_states) {
     const auto& state = kv.second;
-    if (last_sec != 0 && state.seen != last_sec) continue;
+    if (update_count != 0 && state.seen_update < first_update) continue;
 
     for (int i=0; i<state.parse_sigs.size(); i++) {
       const Signal &sig = state.parse_sigs[i];
@@ -9,9 +9,12 @@ from libc.stdint cimport uint32_t, uint64_t, uint16_t
 from libcpp.map cimport map
 
 from collections import defaultdict
+from collections.abc import Mapping
+
+import numpy as np
 
 from common cimport CANParser as cpp_CANParser
-from common cimport SignalParseOptions, MessageParseOptions, dbc_lookup, SignalValue, DBC
+from common cimport SignalParseOptions, MessageParseOptions, dbc_lookup, SignalValue, DBC, Val
 
 
 from libcpp cimport bool
@@ -37,7 +40,13 @@ cdef class CANParser:
     bool can_valid
     int can_invalid_cnt
 
-  def __init__(self, dbc_name, signals, checks=None, bus=0):
+  cdef readonly:
+    dict slots
+    object vl_array
+    object ts_array
+    size_t history_size
+
+  def __init__(self, dbc_name, signals, checks=None, bus=0, history_size=0):
     if checks is None:
       checks = []
 
@@ -49,11 +58,13 @@ cdef class CANParser:
 
     self.can_invalid_cnt = CAN_INVALID_CNT
 
+    address_to_name = {}
     num_msgs = self.dbc[0].num_msgs
     for i in range(num_msgs):
       msg = self.dbc[0].msgs[i]
       name = msg.name.decode('utf8')
 
+      address_to_name[msg.address] = name
       self.msg_name_to_address[name] = msg.address
       self.address_to_msg_name[msg.address] = name
       self.vl[msg.address] = {}
@@ -94,22 +105,59 @@ cdef class CANParser:
       mpo.check_frequency = freq
       message_options_v.push_back(mpo)
 
-    self.can = new cpp_CANParser(bus, dbc_name, message_options_v, signal_options_v)
-    self.update_vl()
+    self.history_size = history_size
+    self.can = new cpp_CANParser(bus, dbc_name, message_options_v, signal_options_v, history_size)
 
-  cdef unordered_set[uint32_t] update_vl(self):
-    cdef string sig_name
-    cdef unordered_set[uint32_t] updated_val
+    # Every requested signal gets a fixed slot, in the order of signals. vl_array and ts_array
+    # are views of the C++ slot buffers, so reading them by slot avoids the vl/ts dicts.
+    # ts_array holds the logMonoTime of the last update of the signal.
+    self.slots = {}
+    for k, (sig_name, sig_address, _) in enumerate(signals):
+      self.slots.setdefault((sig_address, sig_name), k)
+      self.slots.setdefault((address_to_name[sig_address], sig_name), k)
+
+    cdef size_t num_slots = self.can.slot_values.size()
+    if num_slots > 0:
+      self.vl_array = <double[:num_slots]> self.can.slot_values.data()
+      self.ts_array = <uint64_t[:num_slots]> self.can.slot_ts.data()
+    else:
+      self.vl_array = memoryview(b'').cast('d')
+      self.ts_array = memoryview(b'').cast('Q')
+
+    self.update_valid()
+    self.update_vl(0)
 
-    can_values = self.can.query_latest()
-    valid = self.can.can_valid
+  def history(self, msg, sig):
+    """Returns the last history_size (values, logMonoTimes) of a signal as numpy arrays, oldest first."""
+    if self.history_size == 0:
+      raise ValueError("CANParser was created without history_size")
 
+    k = self.slots[(msg, sig)]
+    cdef uint64_t count = self.can.history_count[k]
+    cdef size_t start = k * self.history_size
+
+    vals = np.asarray(<double[:self.history_size]> &self.can.history_values[start])
+    ts = np.asarray(<uint64_t[:self.history_size]> &self.can.history_ts[start])
+
+    if count <= self.history_size:
+      return vals[:count].copy(), ts[:count].copy()
+
+    # ring buffer wrapped, the oldest sample is at the write position
+    head = count % self.history_size
+    return np.concatenate((vals[head:], vals[:head])), np.concatenate((ts[head:], ts[:head]))
+
+  cdef void update_valid(self):
     # Update invalid flag
     self.can_invalid_cnt += 1
-    if valid:
+    if self.can.can_valid:
         self.can_invalid_cnt = 0
     self.can_valid = self.can_invalid_cnt < CAN_INVALID_CNT
 
+  cdef unordered_set[uint32_t] update_vl(self, uint64_t first_update):
+    cdef string sig_name
+    cdef unordered_set[uint32_t] updated_val
+
+    can_values = self.can.query_since(first_update)
 
     for cv in can_values:
       # Cast char * directly to unicde
@@ -128,61 +176,118 @@ cdef class CANParser:
 
   def update_string(self, dat, sendcan=False):
     self.can.update_string(dat, sendcan)
-    return self.update_vl()
+    self.update_valid()
+    return self.update_vl(self.can.update_count)
 
   def update_strings(self, strings, sendcan=False):
-    updated_vals = set()
+    # Parse all strings in C++ first and only convert the values to python once,
+    # values overwritten within the batch are never materialized
+    cdef uint64_t first_update = self.can.update_count + 1
 
     for s in strings:
-      updated_val = self.update_string(s, sendcan)
-      updated_vals.update(updated_val)
+      self.can.update_string(s, sendcan)
+      self.update_valid()
 
-    return updated_vals
+    if self.can.update_count < first_update:
+      return set()
 
-cdef class CANDefine():
+    return self.update_vl(first_update)
+
+cdef class CANDefineValues:
+  """Mapping from message address or name to the value tables of its signals.
+  A message's tables are only decoded from the DBC on first access."""
   cdef:
     const DBC *dbc
-
-  cdef public:
-    dict dv
-    string dbc_name
+    dict msg_name_to_address
+    dict address_to_msg_name
+    dict val_indices
+    dict tables
 
   def __init__(self, dbc_name):
-    self.dbc_name = dbc_name
     self.dbc = dbc_lookup(dbc_name)
-
-    num_vals = self.dbc[0].num_vals
-
-    address_to_msg_name = {}
+    self.msg_name_to_address = {}
+    self.address_to_msg_name = {}
+    self.val_indices = {}
+    self.tables = {}
 
     num_msgs = self.dbc[0].num_msgs
     for i in range(num_msgs):
       msg = self.dbc[0].msgs[i]
       name = msg.name.decode('utf8')
-      address = msg.address
-      address_to_msg_name[address] = name
-
-    dv = defaultdict(dict)
+      self.msg_name_to_address[name] = msg.address
+      self.address_to_msg_name[msg.address] = name
 
+    num_vals = self.dbc[0].num_vals
     for i in range(num_vals):
-      val = self.dbc[0].vals[i]
+      self.val_indices.setdefault(self.dbc[0].vals[i].address, []).append(i)
+
+  def _address(self, key):
+    address = key if isinstance(key, numbers.Number) else self.msg_name_to_address.get(key)
+    if address not in self.val_indices:
+      raise KeyError(key)
+    return address
+
+  def __getitem__(self, key):
+    cdef const Val *val
+    address = self._address(key)
+
+    if address not in self.tables:
+      table = {}
+      for i in self.val_indices[address]:
+        val = &self.dbc[0].vals[<size_t>i]
+
+        #separate definition/value pairs
+        def_val = val.def_val.decode('utf8').split()
+        values = [int(v) for v in def_val[::2]]
+        defs = def_val[1::2]
+        table[val.name.decode('utf8')] = dict(zip(values, defs))
+      self.tables[address] = table
+
+    return self.tables[address]
+
+  def __contains__(self, key):
+    try:
+      self._address(key)
+      return True
+    except KeyError:
+      return False
+
+  def __iter__(self):
+    # two ways to lookup: address or msg name
+    for address in self.val_indices:
+      yield address
+      yield self.address_to_msg_name[address]
+
+  def __len__(self):
+    return 2 * len(self.val_indices)
 
-      sgname = val.name.decode('utf8')
-      address = val.address
-      def_val = val.def_val.decode('utf8')
+  def get(self, key, default=None):
+    return self[key] if key in self else default
 
-      #separate definition/value pairs
-      def_val = def_val.split()
-      values = [int(v) for v in def_val[::2]]
-      defs = def_val[1::2]
+  def keys(self):
+    return list(self)
 
-      if address not in dv:
-        dv[address] = {}
-        msgname = address_to_msg_name[address]
-        dv[msgname] = {}
+  def items(self):
+    return [(k, self[k]) for k in self]
 
-      # two ways to lookup: address or msg name
-      dv[address][sgname] = dict(zip(values, defs))
-      dv[msgname][sgname] = dv[address][sgname]
+  def values(self):
+    return [self[k] for k in self]
+
+
+Mapping.register(CANDefineValues)
+
+# value tables are shared by every CANDefine of the same dbc in the process
+_define_values = {}
+
+
+cdef class CANDefine():
+  cdef public:
+    object dv
+    string dbc_name
+
+  def __init__(self, dbc_name):
+    self.dbc_name = dbc_name
 
-      self.dv = dict(dv)
+    if dbc_name not in _define_values:
+      _define_values[dbc_name] = CANDefineValues(dbc_name)
+    self.dv = _define_values[dbc_name]
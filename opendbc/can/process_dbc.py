@@ -2,12 +2,20 @@
 from __future__ import print_function
 import os
 import sys
+import json
+import time
+import hashlib
+import argparse
 
 import jinja2
 
 from collections import Counter
+from multiprocessing import Pool
+from opendbc.can import dbc as dbc_module
 from opendbc.can.dbc import dbc
 
+MANIFEST_FN = ".manifest.json"
+
 def process(in_fn, out_fn):
   dbc_name = os.path.split(out_fn)[-1].replace('.cc', '')
   #print("processing %s: %s -> %s" % (dbc_name, in_fn, out_fn))
@@ -94,19 +102,85 @@ def process(in_fn, out_fn):
   with open(out_fn, "w") as out_f:
     out_f.write(parser_code)
 
+def file_hash(*fns):
+  h = hashlib.sha1()
+  for fn in fns:
+    with open(fn, "rb") as f:
+      h.update(f.read())
+  return h.hexdigest()
+
+def process_timed(args):
+  in_fn, out_fn = args
+  t = time.time()
+  try:
+    process(in_fn, out_fn)
+  except SystemExit as e:
+    # sanity checks exit, pass the message back instead of killing the pool worker
+    return out_fn, None, str(e)
+  return out_fn, time.time() - t, None
+
+def process_all(dbc_dir, out_dir, jobs=None, force=False):
+  """Generates the code of every dbc in dbc_dir in parallel. Outputs are tracked in a manifest in
+  out_dir, and are only regenerated when the dbc, the template, this script or the dbc parser changed."""
+  manifest_fn = os.path.join(out_dir, MANIFEST_FN)
+  try:
+    with open(manifest_fn) as f:
+      manifest = json.load(f)
+  except (IOError, ValueError):
+    manifest = {}
+
+  template_fn = os.path.join(os.path.dirname(__file__), "dbc_template.cc")
+  generator_hash = file_hash(template_fn, __file__, dbc_module.__file__)
+
+  todo = []
+  hashes = {}
+  for x in sorted(os.listdir(dbc_dir)):
+    if not x.endswith(".dbc"):
+      continue
+    in_fn = os.path.join(dbc_dir, x)
+    out_fn = os.path.join(out_dir, x.replace(".dbc", ".cc"))
+
+    hashes[out_fn] = {"dbc": file_hash(in_fn), "generator": generator_hash}
+    if force or not os.path.exists(out_fn) or manifest.get(os.path.basename(out_fn)) != hashes[out_fn]:
+      todo.append((in_fn, out_fn))
+
+  print("%d of %d dbcs up to date" % (len(hashes) - len(todo), len(hashes)))
+
+  errors = []
+  if len(todo):
+    t = time.time()
+    with Pool(jobs) as pool:
+      for out_fn, dt, err in pool.imap_unordered(process_timed, todo):
+        if err is not None:
+          errors.append(err)
+          manifest.pop(os.path.basename(out_fn), None)
+        else:
+          print("%8.1f ms  %s" % (dt * 1000., out_fn))
+          manifest[os.path.basename(out_fn)] = hashes[out_fn]
+    print("generated %d files in %.2f s" % (len(todo) - len(errors), time.time() - t))
+
+  with open(manifest_fn, "w") as f:
+    json.dump(manifest, f, indent=2, sort_keys=True)
+
+  if len(errors):
+    sys.exit("\n".join(errors))
+
 def main():
-  if len(sys.argv) != 3:
-    print("usage: %s dbc_directory output_filename" % (sys.argv[0],))
-    sys.exit(0)
+  parser = argparse.ArgumentParser(description="Generate dbc C++ sources. Processes every dbc in parallel when output is a directory.")
+  parser.add_argument("--jobs", type=int, default=None, help="number of parallel processes (default: all cores)")
+  parser.add_argument("--force", action="store_true", help="regenerate outputs even if up to date")
+  parser.add_argument("dbc_directory")
+  parser.add_argument("output", help="output filename, or output directory for batch mode")
+  args = parser.parse_args()
 
-  dbc_dir = sys.argv[1]
-  out_fn = sys.argv[2]
+  if os.path.isdir(args.output):
+    process_all(args.dbc_directory, args.output, args.jobs, args.force)
+    return
 
-  dbc_name = os.path.split(out_fn)[-1].replace('.cc', '')
-  in_fn = os.path.join(dbc_dir, dbc_name + '.dbc')
+  dbc_name = os.path.split(args.output)[-1].replace('.cc', '')
+  in_fn = os.path.join(args.dbc_directory, dbc_name + '.dbc')
 
-  process(in_fn, out_fn)
+  process(in_fn, args.output)
 
 if __name__ == '__main__':
   main()
-
@@ -0,0 +1,27 @@
+#!/usr/bin/env python3
+import os
+import random
+import time
+
+from opendbc import DBC_PATH
+from opendbc.can.dbc import dbc
+
+N_FRAMES = 100000
+
+if __name__ == "__main__":
+  can_dbc = dbc(os.path.join(DBC_PATH, "honda_civic_touring_2016_can_generated.dbc"))
+  addresses = [a for a, m in can_dbc.msgs.items() if m[1]]
+
+  random.seed(0)
+  frames = [(random.choice(addresses), i, bytes(random.getrandbits(8) for _ in range(8))) for i in range(N_FRAMES)]
+
+  t = time.time()
+  for f in frames:
+    can_dbc.decode(f)
+  dt_single = time.time() - t
+  print("decode:      %8.1f frames/s" % (N_FRAMES / dt_single))
+
+  t = time.time()
+  can_dbc.decode_many([f[0] for f in frames], [f[1] for f in frames], b"".join(f[2] for f in frames))
+  dt_many = time.time() - t
+  print("decode_many: %8.1f frames/s (%.1fx)" % (N_FRAMES / dt_many, dt_single / dt_many))
@@ -0,0 +1,243 @@
+#!/usr/bin/env python3
+import os
+import random
+import shutil
+import struct
+import tempfile
+import unittest
+
+from opendbc import DBC_PATH
+from opendbc.can.dbc import dbc
+
+# signed, big endian and signals that run past the end of the frame (negative shift)
+TEST_DBC = """
+BO_ 256 SIGNED: 8 XXX
+ SG_ LE_SIGNED : 0|12@1- (0.5,-3) [0|0] "" XXX
+ SG_ BE_SIGNED : 23|10@0- (1,0) [0|0] "" XXX
+ SG_ BE_UNSIGNED : 39|7@0+ (2,1) [0|0] "" XXX
+ SG_ LE_UNSIGNED : 48|16@1+ (1,0) [0|0] "" XXX
+
+BO_ 257 PAST_END: 8 XXX
+ SG_ FIRST : 7|8@0+ (1,0) [0|0] "" XXX
+ SG_ PAST_END : 63|16@0+ (1,0) [0|0] "" XXX
+
+BO_ 258 SHORT: 4 XXX
+ SG_ BE_SHORT : 7|16@0- (1,0) [0|0] "" XXX
+ SG_ LE_SHORT : 16|16@1+ (0.1,0) [0|0] "" XXX
+
+BO_ 259 WIDE_LE: 8 XXX
+ SG_ LE_64 : 0|64@1- (1,0) [0|0] "" XXX
+
+BO_ 260 WIDE_BE: 8 XXX
+ SG_ BE_63 : 6|63@0- (1,0) [0|0] "" XXX
+"""
+
+
+# encode and decode as they were before signals were compiled into SignalPlans
+def encode_reference(can_dbc, msg_id, dd):
+  msg_def = can_dbc.msgs[msg_id]
+  result = 0
+  for s in msg_def[1]:
+    ival = dd.get(s.name)
+    if ival is not None:
+      ival = int(round((ival / s.factor) - s.offset))
+      if s.is_signed and ival < 0:
+        ival = (1 << s.size) + ival
+
+      if s.is_little_endian:
+        shift = s.start_bit
+      else:
+        b1 = (s.start_bit // 8) * 8 + (-s.start_bit - 1) % 8
+        shift = 64 - (b1 + s.size)
+
+      mask = ((1 << s.size) - 1) << shift
+      dat = (ival & ((1 << s.size) - 1)) << shift
+      if s.is_little_endian:
+        mask = can_dbc.reverse_bytes(mask)
+        dat = can_dbc.reverse_bytes(dat)
+      result &= ~mask
+      result |= dat
+  return struct.pack('>Q', result)[:msg_def[0][1]]
+
+
+def decode_reference(can_dbc, x):
+  st = x[2].ljust(8, b'\x00')
+  out = {}
+  for s in can_dbc.msgs[x[0]][1]:
+    if s.is_little_endian:
+      tmp = struct.unpack("<Q", st)[0]
+      shift = s.start_bit
+    else:
+      tmp = struct.unpack(">Q", st)[0]
+      b1 = (s.start_bit // 8) * 8 + (-s.start_bit - 1) % 8
+      shift = 64 - (b1 + s.size)
+    if shift < 0:
+      continue
+
+    tmp = (tmp >> shift) & ((1 << s.size) - 1)
+    if s.is_signed and (tmp >> (s.size - 1)):
+      tmp -= (1 << s.size)
+    out[s.name] = tmp * s.factor + s.offset
+  return out
+
+
+class TestDBC(unittest.TestCase):
+  def setUp(self):
+    self.tmpdir = tempfile.mkdtemp()
+
+  def tearDown(self):
+    shutil.rmtree(self.tmpdir)
+
+  def _test_dbc(self):
+    fn = os.path.join(self.tmpdir, "test.dbc")
+    with open(fn, "w") as f:
+      f.write(TEST_DBC)
+    return dbc(fn, use_cache=False)
+
+  def _random_frames(self, can_dbc, n):
+    random.seed(0)
+    addresses = [a for a, m in can_dbc.msgs.items() if m[1]]
+    frames = []
+    for i in range(n):
+      address = random.choice(addresses)
+      size = can_dbc.msgs[address][0][1]
+      frames.append((address, i, bytes(random.getrandbits(8) for _ in range(size))))
+    return frames
+
+  def test_encode_reference(self):
+    can_dbc = self._test_dbc()
+    random.seed(0)
+    for _ in range(1000):
+      for address in (256, 258):
+        # values cover the signal ranges and beyond, out of range values wrap around like they always did
+        dd = {s.name: random.uniform(-1.5, 1.5) * (1 << s.size) * s.factor
+              for s in can_dbc.msgs[address][1] if random.random() < 0.8}
+        self.assertEqual(can_dbc.encode(address, dd), encode_reference(can_dbc, address, dd), dd)
+
+    dd = {'FIRST': 3}
+    self.assertEqual(can_dbc.encode('PAST_END', dd), encode_reference(can_dbc, 257, dd))
+    # signals past the end of the frame can't be encoded
+    with self.assertRaises(ValueError):
+      encode_reference(can_dbc, 257, {'PAST_END': 1})
+    with self.assertRaises(ValueError):
+      can_dbc.encode(257, {'PAST_END': 1})
+
+  def test_decode_reference(self):
+    can_dbc = self._test_dbc()
+    random.seed(0)
+    for _ in range(1000):
+      for address, size in ((256, 8), (257, 8), (258, 4), (258, 2)):
+        frame = (address, 0, bytes(random.getrandbits(8) for _ in range(size)))
+        name, out = can_dbc.decode(frame)
+        self.assertEqual(name, can_dbc.msgs[address][0][0])
+        self.assertEqual(out, decode_reference(can_dbc, frame), frame)
+
+        # a subset of signals, in the requested order, missing ones are None
+        expected = decode_reference(can_dbc, frame)
+        arr = ['MISSING'] + list(reversed(list(expected.keys())))
+        self.assertEqual(can_dbc.decode(frame, arr)[1], [expected.get(sig) for sig in arr])
+
+    # signals past the end of the frame are never decoded
+    self.assertEqual(list(can_dbc.decode((257, 0, b'\xff' * 8))[1].keys()), ['FIRST'])
+
+  def test_round_trip(self):
+    can_dbc = self._test_dbc()
+    # the extremes of signals without an offset, encode applies offsets in raw units so those don't round trip
+    for be_signed, le_unsigned in ((-512, 65535), (511, 0), (-1, 1)):
+      dd = {'BE_SIGNED': be_signed, 'LE_UNSIGNED': le_unsigned}
+      out = can_dbc.decode((256, 0, can_dbc.encode('SIGNED', dd)), list(dd.keys()))[1]
+      self.assertEqual(out, list(dd.values()))
+    for be_short, le_short in ((-32768, 6553.5), (32767, 0.1)):
+      out = can_dbc.decode((258, 0, can_dbc.encode('SHORT', {'BE_SHORT': be_short, 'LE_SHORT': le_short})))[1]
+      self.assertEqual(out['BE_SHORT'], be_short)
+      self.assertAlmostEqual(out['LE_SHORT'], le_short)
+
+  def test_decode_many(self):
+    for dbc_file in ["honda_civic_touring_2016_can_generated", "subaru_global_2017"]:
+      can_dbc = dbc(os.path.join(DBC_PATH, dbc_file + ".dbc"))
+      frames = self._random_frames(can_dbc, 500)
+
+      columns = can_dbc.decode_many([f[0] for f in frames], [f[1] for f in frames], [f[2] for f in frames])
+
+      for name, (t, sigs) in columns.items():
+        expected = [(f[1], can_dbc.decode(f)[1]) for f in frames if can_dbc.decode(f)[0] == name]
+        self.assertEqual(list(t), [e[0] for e in expected])
+        for sig, vals in sigs.items():
+          for v, (_, e) in zip(vals, expected):
+            self.assertAlmostEqual(v, e[sig])
+
+  def test_decode_many_wide(self):
+    can_dbc = self._test_dbc()
+    frames = [
+      (259, 0, b'\xff' * 8),
+      (259, 1, b'\x00' * 7 + b'\x80'),
+      (259, 2, b'\xff' * 7 + b'\x7f'),
+      (259, 3, b'\x02' + b'\x00' * 7),
+      (260, 4, b'\x7f' + b'\xff' * 7),
+      (260, 5, b'\x40' + b'\x00' * 7),
+      (260, 6, b'\x3f' + b'\xff' * 7),
+      (260, 7, b'\x80' + b'\x00' * 6 + b'\x03'),
+      (256, 8, b'\xff' * 8),
+    ]
+    columns = can_dbc.decode_many([f[0] for f in frames], [f[1] for f in frames], [f[2] for f in frames])
+
+    self.assertEqual(list(columns['WIDE_LE'][1]['LE_64']), [-1., -2.**63, 2.**63 - 1, 2.])
+    self.assertEqual(list(columns['WIDE_BE'][1]['BE_63']), [-1., -2.**62, 2.**62 - 1, 3.])
+    for name, (t, sigs) in columns.items():
+      for i, frame in enumerate(f for f in frames if can_dbc.decode(f)[0] == name):
+        for sig, val in can_dbc.decode(frame)[1].items():
+          self.assertEqual(sigs[sig][i], val, (frame, sig))
+
+  def test_decode_many_packed(self):
+    can_dbc = dbc(os.path.join(DBC_PATH, "toyota_prius_2017_pt_generated.dbc"))
+    dat = can_dbc.encode('STEER_ANGLE_SENSOR', {'STEER_ANGLE': -6.0, 'STEER_RATE': 4, 'STEER_FRACTION': -0.2})
+
+    columns = can_dbc.decode_many([0x25, 0x25, 0x7ff], [1, 2, 3], dat * 3, arr=['STEER_ANGLE'])
+
+    self.assertEqual(list(columns.keys()), ['STEER_ANGLE_SENSOR'])
+    t, sigs = columns['STEER_ANGLE_SENSOR']
+    self.assertEqual(list(t), [1, 2])
+    self.assertEqual(list(sigs.keys()), ['STEER_ANGLE'])
+    self.assertEqual(list(sigs['STEER_ANGLE']), [-6.0, -6.0])
+
+  def test_decode_many_sizes(self):
+    can_dbc = dbc(os.path.join(DBC_PATH, "toyota_prius_2017_pt_generated.dbc"))
+    dat = can_dbc.encode('STEER_ANGLE_SENSOR', {'STEER_ANGLE': -6.0})
+
+    # packed buffers must be exactly 8 bytes per frame
+    with self.assertRaises(ValueError):
+      can_dbc.decode_many([0x25, 0x25], [1, 2], dat + dat[:6])
+    with self.assertRaises(ValueError):
+      can_dbc.decode_many([0x25], [1], [dat + b'\x00'])
+
+    # short frames are padded like decode does
+    columns = can_dbc.decode_many([0x25], [1], [dat[:2]])
+    self.assertEqual(columns['STEER_ANGLE_SENSOR'][1]['STEER_ANGLE'][0], can_dbc.decode((0x25, 1, dat[:2]))[1]['STEER_ANGLE'])
+
+  def test_cache(self):
+    fn = os.path.join(self.tmpdir, "honda_civic_touring_2016_can_generated.dbc")
+    shutil.copy(os.path.join(DBC_PATH, "honda_civic_touring_2016_can_generated.dbc"), fn)
+
+    parsed = dbc(fn, use_cache=False)
+    self.assertFalse(os.path.exists(parsed.cache_fn))
+
+    dbc(fn)
+    self.assertTrue(os.path.exists(parsed.cache_fn))
+    cached = dbc(fn)
+    self.assertEqual(cached.msgs, parsed.msgs)
+    self.assertEqual(cached.def_vals, parsed.def_vals)
+    self.assertEqual(cached.plans, parsed.plans)
+
+    # a corrupt cache is ignored and rewritten
+    with open(parsed.cache_fn, "wb") as f:
+      f.write(b"garbage")
+    self.assertEqual(dbc(fn).msgs, parsed.msgs)
+
+    # editing the dbc invalidates the cache
+    with open(fn, "a") as f:
+      f.write('BO_ 2047 NEW_MSG: 8 XXX\n SG_ NEW_SIG : 7|8@0+ (1,0) [0|255] "" XXX\n')
+    self.assertIn("NEW_MSG", dbc(fn).msg_name_to_address)
+
+
+if __name__ == "__main__":
+  unittest.main()
@@ -22,6 +22,18 @@ class TestCADNDefine(unittest.TestCase):
                           }
                          )
 
+  def test_shared_lazy_values(self):
+    dbc_file = "honda_civic_touring_2016_can_generated"
+    defs = CANDefine(dbc_file)
+
+    self.assertIs(defs.dv, CANDefine(dbc_file).dv)
+    self.assertIn('GEARBOX', defs.dv)
+    self.assertIn(399, defs.dv)
+    self.assertNotIn('NOT_A_MESSAGE', defs.dv)
+    with self.assertRaises(KeyError):
+      defs.dv['NOT_A_MESSAGE']  # pylint: disable=pointless-statement
+    self.assertEqual(defs.dv['GEARBOX']['GEAR_SHIFTER'][8], 'D')
+
 
 if __name__ == "__main__":
   unittest.main()
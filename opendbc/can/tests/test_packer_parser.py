@@ -8,8 +8,10 @@ import cereal.messaging as messaging
 
 
 # Python implementation so we don't have to depend on boardd
-def can_list_to_can_capnp(can_msgs, msgtype='can'):
+def can_list_to_can_capnp(can_msgs, msgtype='can', log_mono_time=None):
   dat = messaging.new_message()
+  if log_mono_time is not None:
+    dat.logMonoTime = log_mono_time
   dat.init(msgtype, len(can_msgs))
 
   for i, can_msg in enumerate(can_msgs):
@@ -100,6 +102,165 @@ class TestCanParserPacker(unittest.TestCase):
 
         idx += 1
 
+  def test_update_strings(self):
+    dbc_file = "honda_civic_touring_2016_can_generated"
+
+    signals = [
+      ("STEER_TORQUE", "STEERING_CONTROL", 0),
+      ("STEER_TORQUE_REQUEST", "STEERING_CONTROL", 0),
+      ("XMISSION_SPEED", "ENGINE_DATA", 0),
+    ]
+    checks = [("STEERING_CONTROL", 100)]
+
+    parser_single = CANParser(dbc_file, list(signals), list(checks), 0)
+    parser_batch = CANParser(dbc_file, list(signals), list(checks), 0)
+    packer = CANPacker(dbc_file)
+
+    strings = []
+    for idx in range(20):
+      msgs = [packer.make_can_msg("STEERING_CONTROL", 0, {"STEER_TORQUE": idx, "STEER_TORQUE_REQUEST": idx % 2}, idx)]
+      if idx == 3:
+        msgs.append(packer.make_can_msg("ENGINE_DATA", 0, {"XMISSION_SPEED": 12.5}))
+      strings.append(can_list_to_can_capnp(msgs))
+
+    updated = set()
+    for s in strings:
+      updated.update(parser_single.update_string(s))
+
+    self.assertEqual(parser_batch.update_strings(strings), updated)
+    self.assertEqual(parser_batch.vl, parser_single.vl)
+    self.assertEqual(parser_batch.ts, parser_single.ts)
+    self.assertEqual(parser_batch.can_valid, parser_single.can_valid)
+    self.assertEqual(parser_batch.can_invalid_cnt, parser_single.can_invalid_cnt)
+    self.assertAlmostEqual(parser_batch.vl["ENGINE_DATA"]["XMISSION_SPEED"], 12.5)
+    self.assertAlmostEqual(parser_batch.vl["STEERING_CONTROL"]["STEER_TORQUE"], 19)
+
+    self.assertEqual(parser_batch.update_strings([]), set())
+
+  def test_update_strings_out_of_order(self):
+    dbc_file = "honda_civic_touring_2016_can_generated"
+
+    signals = [
+      ("STEER_TORQUE", "STEERING_CONTROL", 0),
+      ("XMISSION_SPEED", "ENGINE_DATA", 0),
+    ]
+    parser_single = CANParser(dbc_file, list(signals), [], 0)
+    parser_batch = CANParser(dbc_file, list(signals), [], 0)
+    packer = CANPacker(dbc_file)
+
+    # messages seen in strings with later logMonoTimes than the first or last string are still in the batch
+    strings = [
+      can_list_to_can_capnp([packer.make_can_msg("STEERING_CONTROL", 0, {"STEER_TORQUE": 1})], log_mono_time=2000),
+      can_list_to_can_capnp([packer.make_can_msg("ENGINE_DATA", 0, {"XMISSION_SPEED": 12.5})], log_mono_time=3000),
+      can_list_to_can_capnp([], log_mono_time=1000),
+    ]
+
+    updated = set()
+    for s in strings:
+      updated.update(parser_single.update_string(s))
+
+    self.assertEqual(len(updated), 2)
+    self.assertEqual(parser_batch.update_strings(strings), updated)
+    self.assertEqual(parser_batch.vl, parser_single.vl)
+    self.assertEqual(parser_batch.ts, parser_single.ts)
+    self.assertAlmostEqual(parser_batch.vl["ENGINE_DATA"]["XMISSION_SPEED"], 12.5)
+    self.assertAlmostEqual(parser_batch.vl["STEERING_CONTROL"]["STEER_TORQUE"], 1)
+
+    # only messages parsed in this batch count as updated, whatever their logMonoTime
+    self.assertEqual(parser_batch.update_strings([can_list_to_can_capnp([], log_mono_time=4000)]), set())
+
+  def test_slot_arrays(self):
+    dbc_file = "honda_civic_touring_2016_can_generated"
+
+    signals = [
+      ("STEER_TORQUE", "STEERING_CONTROL", 5),
+      ("COUNTER", "STEERING_CONTROL", 0),
+      ("XMISSION_SPEED", "ENGINE_DATA", 3),
+    ]
+
+    parser = CANParser(dbc_file, signals, [], 0)
+    packer = CANPacker(dbc_file)
+
+    torque_slot = parser.slots[("STEERING_CONTROL", "STEER_TORQUE")]
+    speed_slot = parser.slots[("ENGINE_DATA", "XMISSION_SPEED")]
+    self.assertEqual(torque_slot, parser.slots[(0xe4, "STEER_TORQUE")])
+    self.assertEqual(len(parser.vl_array), 3)
+    self.assertEqual(parser.vl_array[torque_slot], 5)
+    self.assertEqual(parser.vl_array[speed_slot], 3)
+
+    for idx in range(10):
+      msgs = packer.make_can_msg("STEERING_CONTROL", 0, {"STEER_TORQUE": idx}, idx)
+      parser.update_string(can_list_to_can_capnp([msgs]))
+
+      self.assertAlmostEqual(parser.vl_array[torque_slot], parser.vl["STEERING_CONTROL"]["STEER_TORQUE"])
+      self.assertAlmostEqual(parser.vl_array[parser.slots[("STEERING_CONTROL", "COUNTER")]], idx % 4)
+      self.assertEqual(parser.vl_array[speed_slot], 3)
+      self.assertGreater(parser.ts_array[torque_slot], 0)
+      self.assertEqual(parser.ts_array[speed_slot], 0)
+
+  def test_history(self):
+    dbc_file = "honda_civic_touring_2016_can_generated"
+
+    signals = [
+      ("STEER_TORQUE", "STEERING_CONTROL", 0),
+      ("XMISSION_SPEED", "ENGINE_DATA", 0),
+    ]
+
+    parser = CANParser(dbc_file, signals, [], 0, history_size=4)
+    packer = CANPacker(dbc_file)
+
+    vals, ts = parser.history("STEERING_CONTROL", "STEER_TORQUE")
+    self.assertEqual(len(vals), 0)
+    self.assertEqual(len(ts), 0)
+
+    # all samples are kept, even when several arrive in one update_strings call
+    strings = []
+    for idx in range(6):
+      msgs = packer.make_can_msg("STEERING_CONTROL", 0, {"STEER_TORQUE": idx}, idx)
+      strings.append(can_list_to_can_capnp([msgs]))
+    parser.update_strings(strings)
+
+    vals, ts = parser.history("STEERING_CONTROL", "STEER_TORQUE")
+    self.assertEqual(list(vals), [2, 3, 4, 5])
+    self.assertEqual(list(ts), sorted(ts))
+    self.assertEqual(len(parser.history("ENGINE_DATA", "XMISSION_SPEED")[0]), 0)
+
+    with self.assertRaises(ValueError):
+      CANParser(dbc_file, signals, [], 0).history("STEERING_CONTROL", "STEER_TORQUE")
+
+  def test_pack_many_and_template(self):
+    dbc_file = "honda_civic_touring_2016_can_generated"
+    packer = CANPacker(dbc_file)
+
+    static = {
+      "COMPUTER_BRAKE": 0,
+      "COMPUTER_BRAKE_REQUEST": 0,
+      "SET_ME_1": 1,
+      "CHIME": 2,
+    }
+    values = dict(static, COMPUTER_BRAKE=100, COMPUTER_BRAKE_REQUEST=1)
+    expected = [packer.make_can_msg("BRAKE_COMMAND", 0, values, idx) for idx in range(4)]
+    expected_steer = packer.make_can_msg("STEERING_CONTROL", 2, {"STEER_TORQUE": -5}, 1)
+
+    msgs = packer.pack_many([
+      ("BRAKE_COMMAND", 0, values, 0),
+      ("STEERING_CONTROL", 2, {"STEER_TORQUE": -5}, 1),
+    ])
+    self.assertEqual(msgs, [expected[0], expected_steer])
+
+    # with a template only changed signals are passed, counter and checksum are still updated
+    template = packer.make_template("BRAKE_COMMAND", static)
+    changed = {"COMPUTER_BRAKE": 100, "COMPUTER_BRAKE_REQUEST": 1}
+    for idx in range(4):
+      msg = packer.make_can_msg("BRAKE_COMMAND", 0, changed, idx, template=template)
+      self.assertEqual(msg, expected[idx])
+    self.assertEqual(packer.pack_many([("BRAKE_COMMAND", 0, changed, 2, template)]), [expected[2]])
+
+    # the template doesn't change calls that don't pass it
+    self.assertNotEqual(packer.make_can_msg("BRAKE_COMMAND", 0, changed, 0), expected[0])
+    with self.assertRaises(ValueError):
+      packer.make_can_msg("STEERING_CONTROL", 2, {"STEER_TORQUE": -5}, 1, template=template)
+
 
 if __name__ == "__main__":
   unittest.main()
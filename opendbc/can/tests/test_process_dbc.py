@@ -0,0 +1,76 @@
+#!/usr/bin/env python3
+import os
+import json
+import shutil
+import tempfile
+import unittest
+
+from opendbc import DBC_PATH
+from opendbc.can.process_dbc import MANIFEST_FN, process_all
+
+DBC_FILES = ["gm_global_a_chassis", "cadillac_ct6_chassis", "luxgen_s5_2015"]
+
+
+class TestProcessDBC(unittest.TestCase):
+  def setUp(self):
+    self.tmpdir = tempfile.mkdtemp()
+    self.dbc_dir = os.path.join(self.tmpdir, "dbc")
+    self.out_dir = os.path.join(self.tmpdir, "out")
+    os.mkdir(self.dbc_dir)
+    os.mkdir(self.out_dir)
+    for x in DBC_FILES:
+      shutil.copy(os.path.join(DBC_PATH, x + ".dbc"), self.dbc_dir)
+
+  def tearDown(self):
+    shutil.rmtree(self.tmpdir)
+
+  def _out_fn(self, name):
+    return os.path.join(self.out_dir, name + ".cc")
+
+  def _process(self, **kwargs):
+    # mark every output as old, outputs that get regenerated have a new mtime afterwards
+    for x in DBC_FILES:
+      if os.path.exists(self._out_fn(x)):
+        os.utime(self._out_fn(x), (0, 0))
+    process_all(self.dbc_dir, self.out_dir, jobs=2, **kwargs)
+    return {x for x in DBC_FILES if os.stat(self._out_fn(x)).st_mtime != 0}
+
+  def test_incremental(self):
+    self.assertEqual(self._process(), set(DBC_FILES))
+    with open(os.path.join(self.out_dir, MANIFEST_FN)) as f:
+      self.assertEqual(set(json.load(f).keys()), {x + ".cc" for x in DBC_FILES})
+
+    # nothing changed
+    self.assertEqual(self._process(), set())
+
+    # only the changed dbc is regenerated
+    with open(os.path.join(self.dbc_dir, DBC_FILES[0] + ".dbc"), "a") as f:
+      f.write("\n")
+    self.assertEqual(self._process(), {DBC_FILES[0]})
+
+    # a removed output is regenerated
+    os.remove(self._out_fn(DBC_FILES[1]))
+    self.assertEqual(self._process(), {DBC_FILES[1]})
+
+    self.assertEqual(self._process(force=True), set(DBC_FILES))
+
+  def test_generator_changed(self):
+    self._process()
+
+    # outputs generated by another template or parser are rebuilt
+    manifest_fn = os.path.join(self.out_dir, MANIFEST_FN)
+    with open(manifest_fn) as f:
+      manifest = json.load(f)
+    manifest[DBC_FILES[2] + ".cc"]["generator"] = "0" * 40
+    with open(manifest_fn, "w") as f:
+      json.dump(manifest, f)
+    self.assertEqual(self._process(), {DBC_FILES[2]})
+
+    # a corrupt manifest rebuilds everything
+    with open(manifest_fn, "w") as f:
+      f.write("{")
+    self.assertEqual(self._process(), set(DBC_FILES))
+
+
+if __name__ == "__main__":
+  unittest.main()
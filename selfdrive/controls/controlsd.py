@@ -426,7 +426,7 @@ def data_send(sm, pm, CS, CI, CP, VM, state, events, actuators, v_cruise_kph, rk
     dat.controlsState.lateralControlState.lqrState = lac_log
   elif CP.lateralTuning.which() == 'indi':
     dat.controlsState.lateralControlState.indiState = lac_log
-  pm.send('controlsState', dat)
+  msgs = [('controlsState', dat)]
 
   # carState
   cs_send = messaging.new_message()
@@ -434,7 +434,7 @@ def data_send(sm, pm, CS, CI, CP, VM, state, events, actuators, v_cruise_kph, rk
   cs_send.valid = CS.canValid
   cs_send.carState = CS
   cs_send.carState.events = events
-  pm.send('carState', cs_send)
+  msgs.append(('carState', cs_send))
 
   # carEvents - logged every second or on change
   events_bytes = events_to_bytes(events)
@@ -442,21 +442,22 @@ def data_send(sm, pm, CS, CI, CP, VM, state, events, actuators, v_cruise_kph, rk
     ce_send = messaging.new_message()
     ce_send.init('carEvents', len(events))
     ce_send.carEvents = events
-    pm.send('carEvents', ce_send)
+    msgs.append(('carEvents', ce_send))
 
   # carParams - logged every 50 seconds (> 1 per segment)
   if (sm.frame % int(50. / DT_CTRL) == 0):
     cp_send = messaging.new_message()
     cp_send.init('carParams')
     cp_send.carParams = CP
-    pm.send('carParams', cp_send)
+    msgs.append(('carParams', cp_send))
 
   # carControl
   cc_send = messaging.new_message()
   cc_send.init('carControl')
   cc_send.valid = CS.canValid
   cc_send.carControl = CC
-  pm.send('carControl', cc_send)
+  msgs.append(('carControl', cc_send))
+  pm.send_many(msgs)
 
   return CC, events_bytes
 
@@ -553,69 +554,72 @@ def controlsd_thread(sm=None, pm=None, can_sock=None):
 
   internet_needed = params.get("Offroad_ConnectivityNeeded", encoding='utf8') is not None
 
-  prof = Profiler(False)  # off by default
+  # off by default, PROFILE=1 prints span summaries every second, PROFILE=publish sends them on profile
+  prof = Profiler(os.getenv("PROFILE") is not None, publish=os.getenv("PROFILE") == "publish")
+  # receive statistics on messagingStats, off by default
+  stats = messaging.enable_stats() if os.getenv("MESSAGING_STATS") is not None else None
 
   while True:
-    start_time = sec_since_boot()
-    prof.checkpoint("Ratekeeper", ignore=True)
-
-    # Sample data and compute car events
-    CS, events, cal_perc, mismatch_counter, can_error_counter = data_sample(CI, CC, sm, can_sock, driver_status, state, mismatch_counter, can_error_counter, params)
-    prof.checkpoint("Sample")
-
-    # Create alerts
-    if not sm.alive['plan'] and sm.alive['pathPlan']:  # only plan not being received: radar not communicating
-      events.append(create_event('radarCommIssue', [ET.NO_ENTRY, ET.SOFT_DISABLE]))
-    elif not sm.all_alive_and_valid():
-      events.append(create_event('commIssue', [ET.NO_ENTRY, ET.SOFT_DISABLE]))
-    if not sm['pathPlan'].mpcSolutionValid:
-      events.append(create_event('plannerError', [ET.NO_ENTRY, ET.IMMEDIATE_DISABLE]))
-    if not sm['pathPlan'].sensorValid:
-      events.append(create_event('sensorDataInvalid', [ET.NO_ENTRY, ET.PERMANENT]))
-    if not sm['pathPlan'].paramsValid:
-      events.append(create_event('vehicleModelInvalid', [ET.WARNING]))
-    if not sm['pathPlan'].posenetValid:
-      events.append(create_event('posenetInvalid', [ET.NO_ENTRY, ET.WARNING]))
-    if not sm['plan'].radarValid:
-      events.append(create_event('radarFault', [ET.NO_ENTRY, ET.SOFT_DISABLE]))
-    if sm['plan'].radarCanError:
-      events.append(create_event('radarCanError', [ET.NO_ENTRY, ET.SOFT_DISABLE]))
-    if not CS.canValid:
-      events.append(create_event('canError', [ET.NO_ENTRY, ET.IMMEDIATE_DISABLE]))
-    if not sounds_available:
-      events.append(create_event('soundsUnavailable', [ET.NO_ENTRY, ET.PERMANENT]))
-    if internet_needed:
-      events.append(create_event('internetConnectivityNeeded', [ET.NO_ENTRY, ET.PERMANENT]))
-    if community_feature_disallowed:
-      events.append(create_event('communityFeatureDisallowed', [ET.PERMANENT]))
-    if read_only and not passive:
-      events.append(create_event('carUnrecognized', [ET.PERMANENT]))
-
-    # Only allow engagement with brake pressed when stopped behind another stopped car
-    if CS.brakePressed and sm['plan'].vTargetFuture >= STARTING_TARGET_SPEED and not CP.radarOffCan and CS.vEgo < 0.3:
-      events.append(create_event('noTarget', [ET.NO_ENTRY, ET.IMMEDIATE_DISABLE]))
-
-    if not read_only:
-      # update control state
-      state, soft_disable_timer, v_cruise_kph, v_cruise_kph_last = \
-        state_transition(sm.frame, CS, CP, state, events, soft_disable_timer, v_cruise_kph, AM)
-      prof.checkpoint("State transition")
-
-    # Compute actuators (runs PID loops and lateral MPC)
-    actuators, v_cruise_kph, driver_status, v_acc, a_acc, lac_log, last_blinker_frame = \
-      state_control(sm.frame, sm.rcv_frame, sm['plan'], sm['pathPlan'], CS, CP, state, events, v_cruise_kph, v_cruise_kph_last, AM, rk,
-                    driver_status, LaC, LoC, read_only, is_metric, cal_perc, last_blinker_frame)
-
-    prof.checkpoint("State Control")
-
-    # Publish data
-    CC, events_prev = data_send(sm, pm, CS, CI, CP, VM, state, events, actuators, v_cruise_kph, rk, AM, driver_status, LaC,
-                                LoC, read_only, start_time, v_acc, a_acc, lac_log, events_prev, last_blinker_frame,
-                                is_ldw_enabled, can_error_counter)
-    prof.checkpoint("Sent")
+    with prof.span("controlsd"):
+      start_time = sec_since_boot()
+
+      # Sample data and compute car events
+      with prof.span("data_sample"):
+        CS, events, cal_perc, mismatch_counter, can_error_counter = data_sample(CI, CC, sm, can_sock, driver_status, state, mismatch_counter, can_error_counter, params)
+
+      # Create alerts
+      if not sm.alive['plan'] and sm.alive['pathPlan']:  # only plan not being received: radar not communicating
+        events.append(create_event('radarCommIssue', [ET.NO_ENTRY, ET.SOFT_DISABLE]))
+      elif not sm.all_alive_and_valid():
+        events.append(create_event('commIssue', [ET.NO_ENTRY, ET.SOFT_DISABLE]))
+      if not sm['pathPlan'].mpcSolutionValid:
+        events.append(create_event('plannerError', [ET.NO_ENTRY, ET.IMMEDIATE_DISABLE]))
+      if not sm['pathPlan'].sensorValid:
+        events.append(create_event('sensorDataInvalid', [ET.NO_ENTRY, ET.PERMANENT]))
+      if not sm['pathPlan'].paramsValid:
+        events.append(create_event('vehicleModelInvalid', [ET.WARNING]))
+      if not sm['pathPlan'].posenetValid:
+        events.append(create_event('posenetInvalid', [ET.NO_ENTRY, ET.WARNING]))
+      if not sm['plan'].radarValid:
+        events.append(create_event('radarFault', [ET.NO_ENTRY, ET.SOFT_DISABLE]))
+      if sm['plan'].radarCanError:
+        events.append(create_event('radarCanError', [ET.NO_ENTRY, ET.SOFT_DISABLE]))
+      if not CS.canValid:
+        events.append(create_event('canError', [ET.NO_ENTRY, ET.IMMEDIATE_DISABLE]))
+      if not sounds_available:
+        events.append(create_event('soundsUnavailable', [ET.NO_ENTRY, ET.PERMANENT]))
+      if internet_needed:
+        events.append(create_event('internetConnectivityNeeded', [ET.NO_ENTRY, ET.PERMANENT]))
+      if community_feature_disallowed:
+        events.append(create_event('communityFeatureDisallowed', [ET.PERMANENT]))
+      if read_only and not passive:
+        events.append(create_event('carUnrecognized', [ET.PERMANENT]))
+
+      # Only allow engagement with brake pressed when stopped behind another stopped car
+      if CS.brakePressed and sm['plan'].vTargetFuture >= STARTING_TARGET_SPEED and not CP.radarOffCan and CS.vEgo < 0.3:
+        events.append(create_event('noTarget', [ET.NO_ENTRY, ET.IMMEDIATE_DISABLE]))
+
+      if not read_only:
+        # update control state
+        with prof.span("state_transition"):
+          state, soft_disable_timer, v_cruise_kph, v_cruise_kph_last = \
+            state_transition(sm.frame, CS, CP, state, events, soft_disable_timer, v_cruise_kph, AM)
+
+      # Compute actuators (runs PID loops and lateral MPC)
+      with prof.span("state_control"):
+        actuators, v_cruise_kph, driver_status, v_acc, a_acc, lac_log, last_blinker_frame = \
+          state_control(sm.frame, sm.rcv_frame, sm['plan'], sm['pathPlan'], CS, CP, state, events, v_cruise_kph, v_cruise_kph_last, AM, rk,
+                        driver_status, LaC, LoC, read_only, is_metric, cal_perc, last_blinker_frame)
+
+      # Publish data
+      with prof.span("data_send"):
+        CC, events_prev = data_send(sm, pm, CS, CI, CP, VM, state, events, actuators, v_cruise_kph, rk, AM, driver_status, LaC,
+                                    LoC, read_only, start_time, v_acc, a_acc, lac_log, events_prev, last_blinker_frame,
+                                    is_ldw_enabled, can_error_counter)
 
     rk.monitor_time()
-    prof.display()
+    if stats is not None:
+      stats.update()
 
 
 def main(sm=None, pm=None, logcan=None):
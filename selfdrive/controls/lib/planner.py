@@ -4,7 +4,6 @@ import numpy as np
 from common.params import Params
 from common.numpy_fast import interp
 
-import cereal.messaging as messaging
 from cereal import car
 from common.realtime import sec_since_boot
 from selfdrive.swaglog import cloudlog
@@ -214,8 +213,7 @@ class Planner():
     radar_can_error = car.RadarData.Error.canError in radar_errors
 
     # **** send the plan ****
-    plan_send = messaging.new_message()
-    plan_send.init('plan')
+    plan_send = pm.builder('plan').reset()
 
     plan_send.valid = sm.all_alive_and_valid(service_list=['carState', 'controlsState', 'radarState'])
 
@@ -237,7 +235,7 @@ class Planner():
     plan_send.plan.radarValid = bool(radar_valid)
     plan_send.plan.radarCanError = bool(radar_can_error)
 
-    plan_send.plan.processingDelay = (plan_send.logMonoTime / 1e9) - sm.rcv_time['radarState']
+    plan_send.plan.processingDelay = sec_since_boot() - sm.rcv_time['radarState']
 
     # Send out fcw
     plan_send.plan.fcw = fcw
@@ -38,7 +38,7 @@ def plannerd_thread(sm=None, pm=None):
   sm['liveParameters'].stiffnessFactor = 1.0
 
   while True:
-    sm.update()
+    sm.update(wait_for=['model', 'radarState'])
 
     if sm.updated['model']:
       PP.update(sm, pm, CP, VM)
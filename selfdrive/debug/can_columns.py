@@ -0,0 +1,123 @@
+#!/usr/bin/env python3
+"""Decode all CAN traffic of a route with a DBC into a single columnar file.
+
+The file can be memory mapped with load_columns() for later analysis, so logs only have to be
+parsed and decoded once per (route, DBC). Columns are named "<can|sendcan>/<bus>/<msg>/<signal>",
+and "<can|sendcan>/<bus>/<msg>/t" holds the logMonoTime of every sample of that message.
+
+File layout: magic, little endian uint64 header length, json header, then every column as raw
+array data aligned to COLUMN_ALIGN bytes. Offsets in the header are relative to the data start.
+"""
+import os
+import json
+import struct
+import argparse
+from collections import defaultdict
+from multiprocessing import Pool
+
+import numpy as np
+
+from opendbc import DBC_PATH
+from opendbc.can.dbc import dbc
+from tools.lib.logreader import LogReader
+
+MAGIC = b"CANCOLS1"
+COLUMN_ALIGN = 64
+
+
+def _align(n):
+  return (n + COLUMN_ALIGN - 1) // COLUMN_ALIGN * COLUMN_ALIGN
+
+
+def decode_events(events, can_dbc):
+  frames = defaultdict(lambda: ([], [], []))
+  for msg in events:
+    which = msg.which()
+    if which not in ("can", "sendcan"):
+      continue
+
+    for c in getattr(msg, which):
+      addresses, times, dats = frames[(which, c.src)]
+      addresses.append(c.address)
+      times.append(msg.logMonoTime)
+      dats.append(c.dat)
+
+  columns = {}
+  for (which, src), (addresses, times, dats) in frames.items():
+    decoded = can_dbc.decode_many(addresses, np.array(times, dtype=np.uint64), dats)
+    for msg_name, (t, sigs) in decoded.items():
+      prefix = "%s/%d/%s/" % (which, src, msg_name)
+      columns[prefix + "t"] = t
+      for sig_name, vals in sigs.items():
+        columns[prefix + sig_name] = vals
+  return columns
+
+
+def decode_segment(args):
+  fn, dbc_name = args
+  return decode_events(LogReader(fn), dbc(os.path.join(DBC_PATH, dbc_name + ".dbc")))
+
+
+def write_columns(fn, columns, meta=None):
+  header = {"meta": meta or {}, "columns": {}}
+  offset = 0
+  for name, arr in sorted(columns.items()):
+    header["columns"][name] = [arr.dtype.str, offset, len(arr)]
+    offset += _align(arr.nbytes)
+
+  header = json.dumps(header).encode("utf8")
+  data_start = _align(len(MAGIC) + 8 + len(header))
+
+  # write to a temp file first, readers should never map a partial file
+  tmp_fn = fn + ".tmp"
+  with open(tmp_fn, "wb") as f:
+    f.write(MAGIC)
+    f.write(struct.pack("<Q", len(header)))
+    f.write(header)
+    for name, (_, col_offset, _) in sorted(json.loads(header)["columns"].items()):
+      f.seek(data_start + col_offset)
+      f.write(np.ascontiguousarray(columns[name]).tobytes())
+  os.rename(tmp_fn, fn)
+
+
+def load_columns(fn):
+  """Returns (meta, columns), where columns maps column name to a read only memory mapped array."""
+  with open(fn, "rb") as f:
+    if f.read(len(MAGIC)) != MAGIC:
+      raise ValueError("%s is not a CAN columns file" % fn)
+    header_len, = struct.unpack("<Q", f.read(8))
+    header = json.loads(f.read(header_len))
+
+  data_start = _align(len(MAGIC) + 8 + header_len)
+  mm = np.memmap(fn, dtype=np.uint8, mode="r")
+
+  columns = {}
+  for name, (dtype, offset, count) in header["columns"].items():
+    dtype = np.dtype(dtype)
+    start = data_start + offset
+    columns[name] = mm[start:start + count * dtype.itemsize].view(dtype)
+  return header["meta"], columns
+
+
+def convert_route(segment_fns, dbc_name, out_fn, jobs=None):
+  with Pool(jobs) as pool:
+    segments = pool.map(decode_segment, [(fn, dbc_name) for fn in segment_fns])
+
+  # segments are in order, so concatenating keeps every column sorted by time
+  names = sorted(set(name for seg in segments for name in seg))
+  columns = {name: np.concatenate([seg[name] for seg in segments if name in seg]) for name in names}
+
+  write_columns(out_fn, columns, {"dbc": dbc_name, "segments": [os.path.abspath(fn) for fn in segment_fns]})
+  return columns
+
+
+if __name__ == "__main__":
+  parser = argparse.ArgumentParser(description="Decode the CAN traffic of a route into a memory mappable columnar file")
+  parser.add_argument("--jobs", type=int, default=None, help="number of segments decoded in parallel (default: all cores)")
+  parser.add_argument("dbc", help="dbc name, e.g. honda_civic_touring_2016_can_generated")
+  parser.add_argument("out", help="output file")
+  parser.add_argument("segments", nargs="+", help="rlogs of the route, in order")
+  args = parser.parse_args()
+
+  columns = convert_route(args.segments, args.dbc, args.out, args.jobs)
+  print("wrote %d columns to %s" % (len(columns), args.out))
@@ -4,6 +4,8 @@ import numpy as np
 from collections import defaultdict, deque
 from common.realtime import sec_since_boot
 import cereal.messaging as messaging
+from cereal import log
+from cereal.messaging.projection import Projection
 
 
 if __name__ == "__main__":
@@ -11,6 +13,7 @@ if __name__ == "__main__":
   poller = messaging.Poller()
 
   parser = argparse.ArgumentParser()
+  parser.add_argument("--stats", action="store_true", help="also show messagingStats, run controlsd with MESSAGING_STATS=1")
   parser.add_argument("socket", type=str, nargs='*', help="socket name")
   args = parser.parse_args()
 
@@ -18,26 +21,52 @@ if __name__ == "__main__":
   sockets = {}
 
   rcv_times = defaultdict(lambda: deque(maxlen=100))
+  latencies = defaultdict(lambda: deque(maxlen=1000))
+  counters = {}
 
   t = sec_since_boot()
-  for name in socket_names:
+  for name in socket_names + (['messagingStats'] if args.stats else []):
     sock = messaging.sub_sock(name, poller=poller)
     sockets[sock] = name
 
+  # only logMonoTime is read from the raw messages, only messagingStats events are fully decoded
+  projection = Projection(["logMonoTime"])
+
   prev_print = t
   while True:
     for socket in poller.poll(100):
-      msg = messaging.recv_one(socket)
-      name = msg.which()
+      dat = socket.receive()
+      name = projection.which(dat)
 
       t = sec_since_boot()
-      rcv_times[name].append(msg.logMonoTime / 1e9)
+      if name == 'messagingStats':
+        msg = log.Event.from_bytes(dat)
+        for i, s in enumerate(msg.messagingStats.sockets):
+          key = (msg.messagingStats.pid, i, s.service)
+          latencies[key].extend(s.latencies)
+          counters[key] = (s.received, s.dropped, s.maxQueueDepth)
+        if name not in socket_names:
+          continue
+
+      log_mono_time, = projection(dat)
+      rcv_times[name].append(log_mono_time / 1e9)
 
     if t - prev_print > 1:
       print()
       for name in socket_names:
         dts = np.diff(rcv_times[name])
+        if len(dts) == 0:
+          continue
         mean = np.mean(dts)
-        print("%s: Freq %.2f Hz, Min %.2f%%, Max %.2f%%" % (name, 1.0 / mean, np.min(dts) / mean * 100, np.max(dts) / mean * 100))
+        p50, p90, p99 = np.percentile(dts, [50, 90, 99]) * 1e3
+        print("%s: Freq %.2f Hz, Min %.2f%%, Max %.2f%%, dt p50 %.1f ms, p90 %.1f ms, p99 %.1f ms" %
+              (name, 1.0 / mean, np.min(dts) / mean * 100, np.max(dts) / mean * 100, p50, p90, p99))
+
+      for key, (received, dropped, depth) in sorted(counters.items()):
+        if len(latencies[key]) == 0:
+          continue
+        p50, p90, p99 = np.percentile(latencies[key], [50, 90, 99]) * 1e3
+        print("pid %d socket %d %s: received %d, dropped %d, max queue depth %d, latency p50 %.2f ms, p90 %.2f ms, p99 %.2f ms" %
+              (key + (received, dropped, depth, p50, p90, p99)))
 
       prev_print = t
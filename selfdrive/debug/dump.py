@@ -7,6 +7,7 @@ from hexdump import hexdump
 
 from cereal import log
 import cereal.messaging as messaging
+from cereal.messaging.projection import Projection
 from cereal.services import service_list
 
 if __name__ == "__main__":
@@ -33,13 +34,21 @@ if __name__ == "__main__":
 
   values = None
   if args.values:
-    values = [s.strip().split(".") for s in args.values.split(",")]
+    values = []
+    for value in (s.strip() for s in args.values.split(",")):
+      try:
+        Projection([value])
+      except KeyError:
+        print("Warning, skipping {}, not a field of the event".format(value), file=sys.stderr)
+        continue
+      values.append(value)
+    # only the monitored values are read from the raw messages
+    projection = Projection(["logMonoTime"] + values)
 
   while 1:
     polld = poller.poll(1000)
     for sock in polld:
       msg = sock.receive()
-      evt = log.Event.from_bytes(msg)
 
       if not args.no_print:
         if args.pipe:
@@ -50,15 +59,13 @@ if __name__ == "__main__":
         elif args.json:
           print(json.loads(msg))
         elif args.dump_json:
-          print(json.dumps(evt.to_dict()))
-        elif values:
-          print("logMonotime = {}".format(evt.logMonoTime))
-          for value in values:
-            if hasattr(evt, value[0]):
-              item = evt
-              for key in value:
-                item = getattr(item, key)
-              print("{} = {}".format(".".join(value), item))
+          print(json.dumps(log.Event.from_bytes(msg).to_dict()))
+        elif values is not None:
+          log_mono_time, *vals = projection(msg)
+          print("logMonotime = {}".format(log_mono_time))
+          for value, val in zip(values, vals):
+            if val is not None:
+              print("{} = {}".format(value, val))
           print("")
         else:
-          print(evt)
+          print(log.Event.from_bytes(msg))
@@ -0,0 +1,78 @@
+#!/usr/bin/env python3
+import os
+import random
+import shutil
+import tempfile
+import unittest
+
+import numpy as np
+
+from cereal import log
+from opendbc import DBC_PATH
+from opendbc.can.dbc import dbc
+from selfdrive.debug.can_columns import COLUMN_ALIGN, decode_events, load_columns, write_columns
+
+DBC_NAME = "honda_civic_touring_2016_can_generated"
+
+
+class TestCanColumns(unittest.TestCase):
+  def setUp(self):
+    self.tmpdir = tempfile.mkdtemp()
+    self.can_dbc = dbc(os.path.join(DBC_PATH, DBC_NAME + ".dbc"))
+
+  def tearDown(self):
+    shutil.rmtree(self.tmpdir)
+
+  def _events(self, n):
+    random.seed(0)
+    addresses = [a for a, m in self.can_dbc.msgs.items() if m[1]][:20]
+    events, frames = [], []
+    for i in range(n):
+      which = random.choice(["can", "sendcan"])
+      msg = log.Event.new_message()
+      msg.logMonoTime = 1000 + i
+      cans = msg.init(which, 3)
+      for c in cans:
+        c.address = random.choice(addresses)
+        c.src = random.choice([0, 2])
+        c.dat = bytes(random.getrandbits(8) for _ in range(self.can_dbc.msgs[c.address][0][1]))
+        frames.append((which, c.src, (c.address, msg.logMonoTime, c.dat)))
+      events.append(msg)
+    return events, frames
+
+  def test_round_trip(self):
+    events, frames = self._events(200)
+    fn = os.path.join(self.tmpdir, "columns")
+    write_columns(fn, decode_events(events, self.can_dbc), {"dbc": DBC_NAME})
+
+    meta, columns = load_columns(fn)
+    self.assertEqual(meta, {"dbc": DBC_NAME})
+
+    # every column is a read only view of the mapped file, aligned to COLUMN_ALIGN
+    for arr in columns.values():
+      self.assertFalse(arr.flags.writeable)
+      self.assertEqual(arr.ctypes.data % COLUMN_ALIGN, 0)
+
+    # compare every sample with the per frame decoder
+    expected = {}
+    for which, src, frame in frames:
+      name, sigs = self.can_dbc.decode(frame)
+      prefix = "%s/%d/%s/" % (which, src, name)
+      expected.setdefault(prefix + "t", []).append(frame[1])
+      for sig, val in sigs.items():
+        expected.setdefault(prefix + sig, []).append(val)
+
+    self.assertEqual(set(columns.keys()), set(expected.keys()))
+    for name, vals in expected.items():
+      np.testing.assert_allclose(columns[name], vals, err_msg=name)
+
+  def test_bad_magic(self):
+    fn = os.path.join(self.tmpdir, "columns")
+    with open(fn, "wb") as f:
+      f.write(b"\x00" * 64)
+    with self.assertRaises(ValueError):
+      load_columns(fn)
+
+
+if __name__ == "__main__":
+  unittest.main()
@@ -140,7 +140,7 @@ def calibrationd_thread(sm=None, pm=None):
 
   send_counter = 0
   while 1:
-    sm.update()
+    sm.update(wait_for='cameraOdometry')
 
     if sm.updated['cameraOdometry']:
       new_vp = calibrator.handle_cam_odom(sm['cameraOdometry'].trans,
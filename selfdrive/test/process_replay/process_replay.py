@@ -79,7 +79,7 @@ class FakeSubMaster(messaging.SubMaster):
       self.update_ready.clear()
     return self.data[s]
 
-  def update(self, timeout=-1):
+  def update(self, timeout=-1, wait_for=None):
     self.update_called.set()
     self.update_ready.wait()
     self.update_ready.clear()
@@ -97,6 +97,7 @@ class FakePubMaster(messaging.PubMaster):
   def __init__(self, services):
     self.data = {}
     self.sock = {}
+    self.builders = {}
     self.last_updated = None
     for s in services:
       data = messaging.new_message()
@@ -113,12 +114,19 @@ class FakePubMaster(messaging.PubMaster):
     self.last_updated = s
     if isinstance(dat, bytes):
       self.data[s] = log.Event.from_bytes(dat)
+    elif s in self.builders and dat is self.builders[s].msg:
+      # pooled messages get refilled, keep a copy
+      self.data[s] = log.Event.from_bytes(self.builders[s].to_bytes())
     else:
       self.data[s] = dat.as_reader()
     self.send_called.set()
     self.get_called.wait()
     self.get_called.clear()
 
+  def send_many(self, msgs):
+    for s, dat in msgs:
+      self.send(s, dat)
+
   def wait_for_msg(self):
     self.send_called.wait()
     self.send_called.clear()
@@ -7,6 +7,7 @@ import tempfile
 from selfdrive.test.process_replay.compare_logs import compare_logs
 from selfdrive.test.process_replay.process_replay import replay_process, CONFIGS
 from tools.lib.logreader import LogReader
+from cereal.messaging.replay import Segment
 
 segments = [
   "0375fdf7b1ce594d|2019-06-13--08-32-25--3", # HONDA.ACCORD
@@ -54,7 +55,8 @@ if __name__ == "__main__":
       print("failed to get segment %s" % segment)
       sys.exit(1)
 
-    lr = LogReader(rlog_fn)
+    # decompressed and indexed once, every process replays it out of the same mapping
+    lr = Segment(rlog_fn)
 
     for cfg in CONFIGS:
       log_msgs = replay_process(cfg, lr)
@@ -78,6 +80,7 @@ if __name__ == "__main__":
 
       diff = compare_logs(cmp_log_msgs, log_msgs, cfg.ignore)
       results[segment][cfg.proc_name] = diff
+    lr.remove_cache()
     os.remove(rlog_fn)
 
   failed = False
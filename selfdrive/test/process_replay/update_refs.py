@@ -7,7 +7,7 @@ from selfdrive.test.process_replay.compare_logs import save_log
 from selfdrive.test.process_replay.process_replay import replay_process, CONFIGS
 from selfdrive.test.process_replay.test_processes import segments, get_segment
 from selfdrive.version import get_git_commit
-from tools.lib.logreader import LogReader
+from cereal.messaging.replay import Segment
 
 if __name__ == "__main__":
 
@@ -27,7 +27,8 @@ if __name__ == "__main__":
       print("failed to get segment %s" % segment)
       sys.exit(1)
 
-    lr = LogReader(rlog_fn)
+    # decompressed and indexed once, every process replays it out of the same mapping
+    lr = Segment(rlog_fn)
 
     for cfg in CONFIGS:
       log_msgs = replay_process(cfg, lr)
@@ -37,6 +38,7 @@ if __name__ == "__main__":
       if not no_upload:
         upload_file(log_fn, os.path.basename(log_fn))
         os.remove(log_fn)
+    lr.remove_cache()
     os.remove(rlog_fn)
 
   print("done")